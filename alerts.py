@@ -0,0 +1,240 @@
+"""alerts.py – rule-based alert engine evaluated on every ingested reading
+-------------------------------------------------------------------------
+Rules are threshold checks on a single reading field (``rage_probability >= 70``,
+``hr_spike_rate >= 0.3``) or transitions of a label (``alert_level`` changed to
+``"ELEVATED"``). They are compiled once into plain predicates, so evaluating a
+reading costs a dict lookup and a comparison per rule.
+
+A match:
+• writes an ``Event`` row in the same transaction as the reading,
+• queues a push notification that is only sent after that transaction commits
+  (``after_commit`` hook on the session), and
+• respects a per-user/per-rule cooldown and is de-duplicated by
+  (user, rule, reading timestamp), so a re-uploaded offline buffer does not fire
+  twice.
+
+Cooldown, dedup and previous-label state for a transaction is staged in the
+session and only becomes the engine's state in the ``after_commit`` hook. A
+rolled-back batch leaves no trace, so its alerts fire again when it is retried.
+That state is kept in LRUs bounded by ``ALERT_STATE_SIZE`` keys.
+``Event.user_id`` is an integer, so readings whose ``user_id`` has no numeric
+suffix are skipped by every rule (no Event, no push), with one warning per user.
+
+Rules come from ``ALERT_RULES_PATH`` (a JSON list of ``AlertRule`` fields) or
+fall back to ``DEFAULT_RULES``.
+"""
+
+import json
+import logging
+import operator
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from model import SessionLocal  # type: ignore
+from tamar import Event  # type: ignore
+
+log = logging.getLogger("alerts")
+
+ALERT_RULES_PATH = os.getenv("ALERT_RULES_PATH")
+ALERT_STATE_SIZE = int(os.getenv("ALERT_STATE_SIZE", "100000"))   # (user, rule/field) keys
+DEDUP_SIZE = 10_000
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    name: str
+    field: str
+    op: str                       # ">=", ">", "<=", "<", "==", "!=", "changed_to"
+    value: Any
+    event_type: str
+    cooldown_s: float = 300.0
+    title: str = "Alert"
+    message: str = "{field}={actual}"
+
+
+DEFAULT_RULES = [
+    AlertRule("rage_high", "rage_probability", ">=", 70, "rage",
+              title="Rage risk", message="Rage probability {actual:.0f}%"),
+    AlertRule("hr_spikes", "hr_spike_rate", ">=", 0.3, "stress",
+              title="Heart-rate spikes", message="{actual:.0%} of recent beats above baseline"),
+    AlertRule("alert_level_up", "alert_level", "changed_to", ["ELEVATED", "HIGH", "CRITICAL"], "alert_level",
+              cooldown_s=60, title="Alert level", message="Alert level is now {actual}"),
+]
+
+_OPS = {">=": operator.ge, ">": operator.gt, "<=": operator.le,
+        "<": operator.lt, "==": operator.eq, "!=": operator.ne}
+
+
+def load_rules(path: Optional[str] = ALERT_RULES_PATH) -> List[AlertRule]:
+    if not path:
+        return list(DEFAULT_RULES)
+    with open(path, encoding="utf-8") as f:
+        return [AlertRule(**r) for r in json.load(f)]
+
+
+def compile_rule(rule: AlertRule) -> Callable[[Any, Any], bool]:
+    """``rule`` → ``predicate(value, previous_value)``; ``value`` is never ``None``."""
+    if rule.op == "changed_to":
+        targets = frozenset(rule.value if isinstance(rule.value, (list, tuple)) else [rule.value])
+        return lambda v, prev: v in targets and v != prev
+    if rule.op not in _OPS:
+        raise ValueError(f"Rule {rule.name}: unknown op {rule.op!r}")
+    cmp, threshold = _OPS[rule.op], rule.value
+    return lambda v, _prev: cmp(v, threshold)
+
+
+def event_user_id(user_id: str) -> Optional[int]:
+    """``Event.user_id`` is numeric; readings use ids like ``"user_123"``."""
+    m = re.search(r"(\d+)$", str(user_id))
+    return int(m.group(1)) if m else None
+
+
+def new_state() -> Dict[str, dict]:
+    """Staged engine state for one transaction (insertion-ordered, like the LRUs)."""
+    return {"fired": {}, "seen": {}, "previous": {}}
+
+
+def _lru_put(d: OrderedDict, key: Any, value: Any, limit: int) -> None:
+    d[key] = value
+    d.move_to_end(key)
+    while len(d) > limit:
+        d.popitem(last=False)
+
+
+class AlertEngine:
+    """Evaluates compiled rules on ingest; thread-safe (sync routes + stream writer)."""
+
+    def __init__(self, rules: Sequence[AlertRule], state_size: int = ALERT_STATE_SIZE):
+        self.rules = list(rules)
+        self.state_size = state_size
+        self._compiled = [(r, compile_rule(r)) for r in self.rules]
+        self._tracked = {r.field for r in self.rules if r.op == "changed_to"}
+        self._last_fired: "OrderedDict[tuple, float]" = OrderedDict()
+        self._previous: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._seen: "OrderedDict[tuple, None]" = OrderedDict()
+        self._unstorable: "OrderedDict[Any, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        # נקבע ע"י השרת – מקבל dict של התראה ושולח push
+        self.notify: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    def _storable(self, user_id: Any) -> bool:
+        if event_user_id(user_id) is not None:
+            return True
+        if user_id not in self._unstorable:
+            log.warning("Alerts skipped for user_id %r: Event.user_id needs a numeric id", user_id)
+        _lru_put(self._unstorable, user_id, None, self.state_size)
+        return False
+
+    def evaluate(self, rows: Sequence[Dict[str, Any]],
+                 pending: Optional[Dict[str, dict]] = None) -> List[Dict[str, Any]]:
+        """Return one alert dict per (reading, rule) that fires.
+
+        State changes go to ``pending`` (``new_state()``), not to the engine;
+        ``commit_state`` applies them once the readings are stored.
+        """
+        pending = new_state() if pending is None else pending
+        fired = []
+        now = time.monotonic()
+        with self._lock:
+            for row in rows:
+                user_id = row.get("user_id")
+                if user_id is None or not self._storable(user_id):
+                    continue
+                for rule, pred in self._compiled:
+                    v = row.get(rule.field)
+                    if v is None:
+                        continue
+                    pkey = (user_id, rule.field)
+                    prev = pending["previous"][pkey] if pkey in pending["previous"] else self._previous.get(pkey)
+                    if not pred(v, prev):
+                        continue
+                    key = (user_id, rule.name)
+                    last = pending["fired"].get(key, self._last_fired.get(key, -rule.cooldown_s))
+                    if now - last < rule.cooldown_s:
+                        continue
+                    dedup = (user_id, rule.name, row.get("timestamp"))
+                    if dedup in pending["seen"] or dedup in self._seen:
+                        continue
+                    pending["seen"][dedup] = None
+                    pending["fired"][key] = now
+                    fired.append(self._alert(rule, row, v))
+                for field in self._tracked:
+                    if row.get(field) is not None:
+                        pending["previous"][(user_id, field)] = row[field]
+        return fired
+
+    def commit_state(self, pending: Dict[str, dict]) -> None:
+        """Make a committed transaction's staged cooldown / dedup / label state current."""
+        with self._lock:
+            for key, t in pending["fired"].items():
+                _lru_put(self._last_fired, key, t, self.state_size)
+            for key, v in pending["previous"].items():
+                _lru_put(self._previous, key, v, self.state_size)
+            for dedup in pending["seen"]:
+                _lru_put(self._seen, dedup, None, DEDUP_SIZE)
+
+    @staticmethod
+    def _alert(rule: AlertRule, row: Dict[str, Any], actual: Any) -> Dict[str, Any]:
+        try:
+            body = rule.message.format(field=rule.field, actual=actual)
+        except (ValueError, TypeError):
+            body = f"{rule.field}={actual}"
+        return {
+            "rule": rule.name,
+            "event_type": rule.event_type,
+            "user_id": row["user_id"],
+            "device_id": row.get("device_id") or "",
+            "timestamp": row.get("timestamp"),
+            "title": rule.title,
+            "body": body,
+        }
+
+    def apply(self, db: Session, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Evaluate ``rows``, add ``Event`` rows to ``db`` and queue pushes and state for after commit."""
+        # כמה batches יכולים לחלוק commit אחד – כולם רואים את אותו state מושהה
+        fired = self.evaluate(rows, db.info.setdefault("pending_alert_state", new_state()))
+        if not fired:
+            return fired
+        db.add_all([Event(user_id=event_user_id(a["user_id"]), device_id=a["device_id"],
+                          event_type=a["event_type"], timestamp=a["timestamp"], description=a["body"])
+                    for a in fired])
+        db.info.setdefault("pending_alerts", []).extend(fired)
+        log.info("[🚨 ALERT] %d fired: %s", len(fired), ", ".join(a["rule"] for a in fired))
+        return fired
+
+    def dispatch(self, alerts: List[Dict[str, Any]]) -> None:
+        if self.notify is None:
+            return
+        for a in alerts:
+            try:
+                self.notify(a)
+            except Exception:
+                log.exception("Alert push failed: %s", a["rule"])
+
+
+alert_engine = AlertEngine(load_rules())
+
+
+# ה-push וה-cooldown/dedup נכנסים לתוקף רק אחרי שהטרנזקציה של הקריאות וה-Event נשמרה
+@event.listens_for(SessionLocal, "after_commit")
+def _send_pending_alerts(session: Session) -> None:
+    state = session.info.pop("pending_alert_state", None)
+    if state:
+        alert_engine.commit_state(state)
+    pending = session.info.pop("pending_alerts", None)
+    if pending:
+        alert_engine.dispatch(pending)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_pending_alerts(session: Session) -> None:
+    session.info.pop("pending_alert_state", None)
+    session.info.pop("pending_alerts", None)
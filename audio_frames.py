@@ -0,0 +1,48 @@
+"""audio_frames.py – binary WebSocket audio frames for /v1/realtime
+------------------------------------------------------------------
+JSON clients send every chunk as ``{"type":"audio","audio":"<base64>"}``. That
+is a third larger on the wire and costs a JSON parse and a base64 decode per
+frame. Clients that negotiate binary mode send and receive audio as binary
+WebSocket messages instead, each with a 4-byte header:
+
+    version  u8   always ``VERSION``
+    codec    u8   ``CODEC_PCM16`` (16-bit LE mono) or ``CODEC_MP3``
+    seq      u16  per-direction frame counter (wraps at 65536), big-endian
+
+The header is followed by the raw audio. Control messages (``audio_commit``,
+``text``, ``sensor``, the ``*_done`` events, errors) stay JSON text frames.
+
+Negotiation: offer the ``SUBPROTOCOL`` WebSocket subprotocol, or connect with
+``?audio=binary`` when the client library cannot set subprotocols.
+"""
+
+import struct
+from typing import Tuple
+
+SUBPROTOCOL = "realtime.audio.v1"
+VERSION     = 1
+CODEC_PCM16 = 1
+CODEC_MP3   = 2
+
+HEADER = struct.Struct("!BBH")
+
+
+def pack(codec: int, seq: int, payload: bytes) -> bytes:
+    return HEADER.pack(VERSION, codec, seq & 0xFFFF) + payload
+
+
+def unpack(frame: bytes) -> Tuple[int, int, bytes]:
+    """``frame`` → ``(codec, seq, payload)``; ``ValueError`` on a malformed header."""
+    if len(frame) < HEADER.size:
+        raise ValueError("audio frame shorter than its header")
+    version, codec, seq = HEADER.unpack_from(frame)
+    if version != VERSION:
+        raise ValueError(f"unsupported audio frame version {version}")
+    return codec, seq, frame[HEADER.size:]
+
+
+def wants_binary(scope: dict) -> bool:
+    """True if the WebSocket handshake in ``scope`` asked for binary audio."""
+    if SUBPROTOCOL in scope.get("subprotocols", ()):
+        return True
+    return b"audio=binary" in scope.get("query_string", b"").split(b"&")
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""benchmark.py – reproducible HTTP benchmark for the FastAPI server
+---------------------------------------------------------------------
+Starts ``server.app`` in-process (uvicorn on a free localhost port) against a
+fresh temporary SQLite file, seeds a fixed dataset and drives the hot
+endpoints at a configurable concurrency:
+
+    post_reading   POST /readings
+    get_reading    GET  /readings/{id}
+    list_users     GET  /users
+    user_events    GET  /events/check-for-tamar-status/{user_id}
+
+For every scenario it reports throughput and p50/p95/p99 latency as JSON,
+together with the git commit, so runs can be compared across commits:
+
+    python benchmark.py --out bench_main.json
+    python benchmark.py --compare bench_main.json --fail-over 15
+
+dependencies: pip install httpx uvicorn
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+SCENARIOS = ("post_reading", "get_reading", "list_users", "user_events")
+
+
+# ------------------------- Helpers ---------------------------
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=Path(__file__).parent, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def configure_environment(db_path: Path) -> None:
+    """Must run before ``server`` is imported – model.py reads these at import time."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("LOG_SAMPLE_DEFAULT", "0")
+    os.environ.setdefault("FIREBASE_CREDENTIALS", str(db_path.with_suffix(".no-firebase")))
+
+
+def seed(users: int, readings: int, events: int, rng: random.Random) -> Dict[str, List[int]]:
+    """Fixed dataset straight through the ORM (not timed)."""
+    from ingest import insert_readings
+    from model import SessionLocal, User
+    from tamar import Event
+
+    db = SessionLocal()
+    try:
+        db.add_all([User(name=f"user{i}", email=f"user{i}@example.com", user_id=i) for i in range(1, users + 1)])
+        start = datetime(2025, 1, 1)
+        rows = [_reading(rng, rng.randint(1, users), start + timedelta(seconds=i)) for i in range(readings)]
+        ids: List[int] = []
+        for i in range(0, len(rows), 1000):
+            ids += insert_readings(db, rows[i:i + 1000])
+        db.add_all([Event(user_id=rng.randint(1, users), device_id="bench_watch",
+                          event_type=rng.choice(["rage", "stress"]), timestamp=start + timedelta(minutes=i))
+                    for i in range(events)])
+        db.commit()
+        return {"reading_ids": ids, "user_ids": list(range(1, users + 1))}
+    finally:
+        db.close()
+
+
+def _reading(rng: random.Random, user: int, ts: datetime) -> Dict[str, Any]:
+    return {
+        "user_id": f"user_{user}",
+        "device_id": "bench_watch",
+        "timestamp": ts,
+        "heart_rate": rng.randint(55, 140),
+        "hrv_ms": round(rng.uniform(20, 90), 1),
+        "eda_microsiemens": round(rng.uniform(0.5, 12), 2),
+        "skin_temp_c": round(rng.uniform(31, 36), 1),
+        "rage_probability": round(rng.uniform(0, 60), 1),
+    }
+
+
+class ServerThread:
+    """uvicorn running ``server.app`` in a background thread."""
+
+    def __init__(self, port: int):
+        import uvicorn
+        import server
+
+        self.config = uvicorn.Config(server.app, host="127.0.0.1", port=port,
+                                     log_level="warning", access_log=False, lifespan="on")
+        self.server = uvicorn.Server(self.config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.time() + 30
+        while not self.server.started:
+            if time.time() > deadline or not self.thread.is_alive():
+                raise RuntimeError("server failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(10)
+
+
+# ---------- Scenarios ------------------------------------------------------
+def build_requests(name: str, data: Dict[str, List[int]], rng: random.Random) -> Callable[[], tuple]:
+    """Return a factory producing ``(method, url, json_body)`` for scenario ``name``."""
+    if name == "post_reading":
+        def make():
+            body = _reading(rng, rng.choice(data["user_ids"]), datetime(2025, 2, 1) + timedelta(seconds=rng.randint(0, 10**6)))
+            body["timestamp"] = body["timestamp"].isoformat()
+            return "POST", "/readings", body
+    elif name == "get_reading":
+        def make():
+            return "GET", f"/readings/{rng.choice(data['reading_ids'])}", None
+    elif name == "list_users":
+        def make():
+            return "GET", "/users?skip=0&limit=10", None
+    elif name == "user_events":
+        def make():
+            return "GET", f"/events/check-for-tamar-status/{rng.choice(data['user_ids'])}", None
+    else:
+        raise ValueError(f"unknown scenario {name}")
+    return make
+
+
+async def run_scenario(client, make: Callable[[], tuple], requests: int, concurrency: int,
+                       warmup: int) -> Dict[str, Any]:
+    for _ in range(warmup):
+        method, url, body = make()
+        await client.request(method, url, json=body)
+
+    latencies: List[float] = []
+    errors = 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in pending:
+            method, url, body = make()
+            t0 = time.perf_counter()
+            try:
+                resp = await client.request(method, url, json=body)
+                ok = resp.status_code < 400
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - t0)
+            errors += not ok
+
+    t_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t_start
+
+    lat = sorted(latencies)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(lat, 50) * 1000, 2),
+        "p95_ms": round(percentile(lat, 95) * 1000, 2),
+        "p99_ms": round(percentile(lat, 99) * 1000, 2),
+        "max_ms": round(lat[-1] * 1000, 2) if lat else 0.0,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], fail_over: float) -> bool:
+    """Print p95/throughput deltas; return False if any scenario regressed more than ``fail_over`` %."""
+    ok = True
+    print(f"\nvs {baseline.get('commit', '?')}:")
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        d_p95 = (cur["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100 if base["p95_ms"] else 0.0
+        d_rps = (cur["throughput_rps"] - base["throughput_rps"]) / base["throughput_rps"] * 100 \
+            if base["throughput_rps"] else 0.0
+        regressed = d_p95 > fail_over or -d_rps > fail_over
+        ok &= not regressed
+        print(f"  {name:14s} p95 {d_p95:+6.1f}%  rps {d_rps:+6.1f}%  {'REGRESSION' if regressed else ''}")
+    return ok
+
+
+async def main_async(args) -> Dict[str, Any]:
+    import httpx
+
+    rng = random.Random(args.seed)
+    data = seed(args.users, args.readings, args.events, rng)
+    port = free_port()
+    results: Dict[str, Any] = {}
+    with ServerThread(port):
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            for name in args.scenarios:
+                make = build_requests(name, data, random.Random(f"{args.seed}-{name}"))
+                results[name] = await run_scenario(client, make, args.requests, args.concurrency, args.warmup)
+                print(f"{name:14s} {results[name]['throughput_rps']:>9.1f} req/s  "
+                      f"p50 {results[name]['p50_ms']:>7.2f}ms  p95 {results[name]['p95_ms']:>7.2f}ms  "
+                      f"p99 {results[name]['p99_ms']:>7.2f}ms  errors {results[name]['errors']}",
+                      file=sys.stderr)
+    return results
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="HTTP benchmark for the FastAPI server")
+    ap.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    ap.add_argument("--requests", type=int, default=2000, help="timed requests per scenario")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--warmup", type=int, default=50)
+    ap.add_argument("--users", type=int, default=200, help="seeded users")
+    ap.add_argument("--readings", type=int, default=50_000, help="seeded sensor readings")
+    ap.add_argument("--events", type=int, default=5_000, help="seeded events")
+    ap.add_argument("--seed", type=int, default=2025)
+    ap.add_argument("--out", help="write JSON results to this file (default: stdout)")
+    ap.add_argument("--compare", help="baseline JSON from a previous run")
+    ap.add_argument("--fail-over", type=float, default=10.0,
+                    help="with --compare: exit 1 if p95 or throughput regresses by more than this %%")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        configure_environment(Path(tmp) / "bench.db")
+        sys.path.insert(0, str(Path(__file__).parent))
+        results = asyncio.run(main_async(args))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: getattr(args, k) for k in ("requests", "concurrency", "warmup", "users",
+                                                  "readings", "events", "seed")},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if not compare(report, baseline, args.fail_over):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""export.py – streaming columnar export of **SensorReading** rows
+------------------------------------------------------------------
+Reads ``sensor_readings`` for a user/device/time range through a streamed
+cursor and encodes it chunk by chunk as Parquet, Arrow IPC (stream format) or
+CSV, so a month of data never has to sit in memory at once. Parquet/Arrow need
+``pyarrow``; without it every export falls back to CSV.
+
+Used by ``GET /readings/export`` and from the command line:
+    python export.py --user-id user_123 --from 2025-01-01 --to 2025-02-01 \\
+                     --format parquet --out user_123.parquet
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from sqlalchemy import DateTime, Float, Integer, JSON, select
+
+from model import SensorReading, SessionLocal  # type: ignore
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow הוא אופציונלי – בלעדיו רק CSV
+    pa = pq = None
+
+log = logging.getLogger("export")
+
+EXPORT_FORMATS = ("parquet", "arrow", "csv")
+MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow":   "application/vnd.apache.arrow.stream",
+    "csv":     "text/csv",
+}
+EXTENSIONS = {"parquet": "parquet", "arrow": "arrows", "csv": "csv"}
+CHUNK_ROWS = 10_000
+
+COLUMNS = list(SensorReading.__table__.columns)
+COLUMN_NAMES = [c.name for c in COLUMNS]
+JSON_COLUMNS = {c.name for c in COLUMNS if isinstance(c.type, JSON)}
+
+
+def resolve_format(fmt: str) -> str:
+    """Requested format, or ``"csv"`` when pyarrow is not installed."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r} (expected one of {', '.join(EXPORT_FORMATS)})")
+    if fmt != "csv" and pa is None:
+        log.warning("pyarrow not installed – exporting %s request as CSV", fmt)
+        return "csv"
+    return fmt
+
+
+def _arrow_schema():
+    def arrow_type(col):
+        if isinstance(col.type, Integer):
+            return pa.int64()
+        if isinstance(col.type, Float):
+            return pa.float64()
+        if isinstance(col.type, DateTime):
+            return pa.timestamp("us")
+        return pa.string()          # String + JSON (נשמר כטקסט JSON)
+    return pa.schema([pa.field(c.name, arrow_type(c)) for c in COLUMNS])
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose buffered bytes are handed out after every chunk."""
+
+    def __init__(self):
+        super().__init__()
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = bytes(self._buf)
+        self._buf.clear()
+        return out
+
+
+# ──────────────────────────────── row source ───────────────────────────────────
+def iter_reading_chunks(
+    user_id: Optional[str] = None,
+    device_id: Optional[str] = None,
+    from_: Optional[datetime] = None,
+    to: Optional[datetime] = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Iterator[List[tuple]]:
+    """Yield lists of up to ``chunk_rows`` rows, ordered by ``(timestamp, id)``."""
+    stmt = select(*COLUMNS)
+    if user_id is not None:
+        stmt = stmt.where(SensorReading.user_id == user_id)
+    if device_id is not None:
+        stmt = stmt.where(SensorReading.device_id == device_id)
+    if from_ is not None:
+        stmt = stmt.where(SensorReading.timestamp >= from_)
+    if to is not None:
+        stmt = stmt.where(SensorReading.timestamp < to)
+    stmt = stmt.order_by(SensorReading.timestamp, SensorReading.id)
+
+    # ה-session נפתח כאן ולא דרך Depends – הוא חייב לחיות עד סוף ה-streaming
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(stream_results=True, yield_per=chunk_rows))
+        for partition in result.partitions():
+            yield [tuple(r) for r in partition]
+    finally:
+        db.close()
+
+
+def _json_cells(rows: List[tuple]) -> List[list]:
+    """Rows → columns, with JSON columns serialised to text."""
+    cols = [list(c) for c in zip(*rows)]
+    for i, name in enumerate(COLUMN_NAMES):
+        if name in JSON_COLUMNS:
+            cols[i] = [json.dumps(v) if v is not None else None for v in cols[i]]
+    return cols
+
+
+# ───────────────────────────────── encoders ────────────────────────────────────
+def _encode_arrow(chunks: Iterator[List[tuple]], fmt: str) -> Iterator[bytes]:
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_stream(sink, schema)
+    try:
+        for rows in chunks:
+            # ב-Parquet כל chunk נכתב כ-row group משלו
+            writer.write_batch(pa.record_batch(_json_cells(rows), schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _encode_csv(chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMN_NAMES)
+    json_idx = {i for i, name in enumerate(COLUMN_NAMES) if name in JSON_COLUMNS}
+    for rows in chunks:
+        for row in rows:
+            writer.writerow([
+                "" if v is None else json.dumps(v) if i in json_idx
+                else v.isoformat() if isinstance(v, datetime) else v
+                for i, v in enumerate(row)
+            ])
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    tail = buf.getvalue()
+    if tail:
+        yield tail.encode()
+
+
+def export_readings(fmt: str, **filters) -> Iterator[bytes]:
+    """Encoded byte chunks of the filtered readings in ``fmt`` (already resolved)."""
+    chunks = iter_reading_chunks(**filters)
+    if fmt == "csv":
+        return _encode_csv(chunks)
+    return _encode_arrow(chunks, fmt)
+
+
+# ─────────────────────────────────── CLI ───────────────────────────────────────
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Export sensor_readings as Parquet / Arrow IPC / CSV")
+    ap.add_argument("--user-id")
+    ap.add_argument("--device-id")
+    ap.add_argument("--from", dest="from_", type=datetime.fromisoformat, help="ISO start (inclusive)")
+    ap.add_argument("--to", type=datetime.fromisoformat, help="ISO end (exclusive)")
+    ap.add_argument("--format", choices=EXPORT_FORMATS, default="parquet")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--out", required=True, help="output file path")
+    args = ap.parse_args()
+
+    fmt = resolve_format(args.format)
+    written = 0
+    with open(args.out, "wb") as f:
+        for data in export_readings(fmt, user_id=args.user_id, device_id=args.device_id,
+                                    from_=args.from_, to=args.to, chunk_rows=args.chunk_rows):
+            f.write(data)
+            written += len(data)
+    print(f"Wrote {written} bytes of {fmt} to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
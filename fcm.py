@@ -0,0 +1,237 @@
+"""fcm.py – non-blocking, batched Firebase Cloud Messaging dispatch
+------------------------------------------------------------------
+``messaging.send`` is a blocking HTTPS round-trip, and calling it from an
+``async`` route stalls the whole event loop. ``FcmDispatcher`` takes messages
+off the request path instead:
+
+• ``submit`` puts the message on a bounded queue and returns a job id at once.
+• Worker threads drain the queue in groups of up to ``FCM_BATCH_SIZE`` messages
+  and send each group with one ``send_each`` call.
+• Transient failures (unavailable, internal, quota, timeouts) are retried with
+  exponential backoff plus jitter. Tokens FCM reports as unregistered or bound
+  to another sender are remembered (LRU, ``FCM_INVALID_TOKENS`` entries) and
+  never tried again. ``InvalidArgumentError`` fails the job only, since a bad
+  payload says nothing about the token.
+• ``status(job_id)`` reports queued / retrying / sent / failed / invalid_token.
+
+The backend is anything with ``send_each(messages) -> BatchResponse``. It
+defaults to ``firebase_admin.messaging``, and a stub can be passed in tests.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from firebase_admin import exceptions, messaging
+
+from metrics import FCM_SENDS
+
+log = logging.getLogger("fcm")
+
+FCM_QUEUE_SIZE  = int(os.getenv("FCM_QUEUE_SIZE", "10000"))
+FCM_WORKERS     = int(os.getenv("FCM_WORKERS", "2"))
+FCM_BATCH_SIZE  = int(os.getenv("FCM_BATCH_SIZE", "500"))        # מגבלת send_each
+FCM_MAX_RETRIES = int(os.getenv("FCM_MAX_RETRIES", "5"))
+FCM_BASE_DELAY  = float(os.getenv("FCM_BASE_DELAY", "0.5"))
+FCM_MAX_DELAY   = float(os.getenv("FCM_MAX_DELAY", "60"))
+FCM_INVALID_TOKENS = int(os.getenv("FCM_INVALID_TOKENS", "100000"))
+JOB_HISTORY     = 10_000
+
+# רק שגיאות שמעידות על ה-token עצמו; InvalidArgumentError יכולה לנבוע מ-payload פגום
+INVALID_TOKEN_ERRORS = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+RETRYABLE_ERRORS = (exceptions.UnavailableError, exceptions.InternalError,
+                    exceptions.DeadlineExceededError, messaging.QuotaExceededError,
+                    exceptions.UnknownError, ConnectionError, TimeoutError)
+
+
+def build_message(title: str, body: str, data: Optional[dict] = None,
+                  token: Optional[str] = None, topic: Optional[str] = None) -> messaging.Message:
+    """Notification message for one device ``token`` or every subscriber of ``topic``."""
+    return messaging.Message(
+        notification=messaging.Notification(title=title, body=body),
+        data={k: str(v) for k, v in (data or {}).items()},
+        token=token,
+        topic=topic,
+    )
+
+
+class _Job:
+    __slots__ = ("id", "message", "attempts", "state", "message_id", "error")
+
+    def __init__(self, message: messaging.Message):
+        self.id = uuid.uuid4().hex
+        self.message = message
+        self.attempts = 0
+        self.state = "queued"
+        self.message_id: Optional[str] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"job_id": self.id, "status": self.state, "attempts": self.attempts,
+                "message_id": self.message_id, "error": self.error}
+
+
+class FcmDispatcher:
+    def __init__(self, backend: Any = None, workers: int = FCM_WORKERS, max_queue: int = FCM_QUEUE_SIZE,
+                 batch_size: int = FCM_BATCH_SIZE, max_retries: int = FCM_MAX_RETRIES,
+                 base_delay: float = FCM_BASE_DELAY, max_delay: float = FCM_MAX_DELAY,
+                 max_invalid_tokens: int = FCM_INVALID_TOKENS):
+        self.backend = backend or messaging
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_invalid_tokens = max_invalid_tokens
+        self._queue: "queue.Queue[_Job]" = queue.Queue(maxsize=max_queue)
+        self._jobs: "OrderedDict[str, _Job]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._invalid_tokens: "OrderedDict[str, None]" = OrderedDict()
+        self._invalid_lock = threading.Lock()
+        # תור ה-retry: (due, seq, job) – thread אחד מחזיר אותם לתור הראשי בזמן
+        self._retries: List[tuple] = []
+        self._retry_cv = threading.Condition()
+        self._seq = itertools.count()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"fcm-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._retry_loop, name="fcm-retry", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        with self._retry_cv:
+            self._retry_cv.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads.clear()
+
+    # ---------- API ----------
+    def submit(self, message: messaging.Message) -> str:
+        """Queue ``message``; raises ``queue.Full`` when the dispatcher is saturated."""
+        job = _Job(message)
+        if message.token and self._is_invalid(message.token):
+            job.state, job.error = "invalid_token", "token previously rejected by FCM"
+            self._remember(job)
+            return job.id
+        self._queue.put_nowait(job)
+        self._remember(job)
+        return job.id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            return job.as_dict() if job else None
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def _remember(self, job: _Job) -> None:
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > JOB_HISTORY:
+                self._jobs.popitem(last=False)
+
+    def _is_invalid(self, token: str) -> bool:
+        with self._invalid_lock:
+            if token in self._invalid_tokens:
+                self._invalid_tokens.move_to_end(token)
+                return True
+            return False
+
+    def _mark_invalid(self, token: str) -> None:
+        with self._invalid_lock:
+            self._invalid_tokens[token] = None
+            self._invalid_tokens.move_to_end(token)
+            while len(self._invalid_tokens) > self.max_invalid_tokens:
+                self._invalid_tokens.popitem(last=False)
+
+    # ---------- workers ----------
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._send(batch)
+
+    def _send(self, batch: List[_Job]) -> None:
+        for job in batch:
+            job.attempts += 1
+        try:
+            responses = self.backend.send_each([j.message for j in batch]).responses
+        except Exception as e:
+            # כל ה-batch נכשל (רשת / auth) – מטפלים בכל הודעה בנפרד
+            responses = [None] * len(batch)
+            errors = [e] * len(batch)
+        else:
+            errors = [None if r.success else r.exception for r in responses]
+
+        for job, resp, err in zip(batch, responses, errors):
+            if err is None:
+                job.state, job.message_id, job.error = "sent", resp.message_id, None
+                FCM_SENDS.inc(outcome="sent")
+            elif isinstance(err, INVALID_TOKEN_ERRORS):
+                job.state, job.error = "invalid_token", str(err)
+                if job.message.token:
+                    self._mark_invalid(job.message.token)
+                FCM_SENDS.inc(outcome="invalid_token")
+            elif isinstance(err, RETRYABLE_ERRORS) and job.attempts <= self.max_retries:
+                job.state, job.error = "retrying", str(err)
+                self._schedule_retry(job)
+                FCM_SENDS.inc(outcome="retry")
+            else:
+                job.state, job.error = "failed", str(err)
+                log.warning("FCM job %s failed after %d attempts: %s", job.id, job.attempts, err)
+                FCM_SENDS.inc(outcome="failed")
+
+    def _schedule_retry(self, job: _Job) -> None:
+        delay = min(self.max_delay, self.base_delay * 2 ** (job.attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        with self._retry_cv:
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), job))
+            self._retry_cv.notify()
+
+    def _retry_loop(self) -> None:
+        with self._retry_cv:
+            while not self._stop.is_set():
+                if not self._retries:
+                    self._retry_cv.wait()
+                    continue
+                due, _, job = self._retries[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._retry_cv.wait(wait)
+                    continue
+                heapq.heappop(self._retries)
+                try:
+                    self._queue.put_nowait(job)
+                except queue.Full:
+                    job.state, job.error = "failed", "dispatch queue full on retry"
+                    FCM_SENDS.inc(outcome="failed")
+
+
+fcm_dispatcher = FcmDispatcher()
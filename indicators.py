@@ -0,0 +1,198 @@
+"""indicators.py – server-side HR baseline, spike rate and HRV drop
+-------------------------------------------------------------------
+Watches used to compute ``hr_baseline``, ``hr_spike_rate`` and
+``hrv_drop_percent`` themselves, which costs battery and gives different
+numbers per firmware. ``IndicatorEngine`` keeps a small rolling state per user
+and fills those fields in on ingest whenever the device left them out.
+
+Every update is O(1):
+• HR / HRV baselines are exponentially weighted moving averages.
+• Spike rate is the share of spikes in a fixed-size ring buffer, with a running
+  counter so nothing is re-scanned.
+
+On the ingest path (``apply``) the rows are filled from per-transaction copies
+of the user state, staged in ``session.info``; the readings are replayed onto
+the engine's state in the session's ``after_commit`` hook, so a rolled-back
+batch never moves a baseline.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Iterable, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from model import SensorReading, SessionLocal  # type: ignore
+
+log = logging.getLogger("indicators")
+
+BASELINE_ALPHA   = float(os.getenv("INDICATOR_BASELINE_ALPHA", "0.02"))   # ~50 דגימות
+SPIKE_WINDOW     = int(os.getenv("INDICATOR_SPIKE_WINDOW", "60"))
+SPIKE_THRESHOLD  = float(os.getenv("INDICATOR_SPIKE_THRESHOLD", "0.20"))  # 20% מעל ה-baseline
+WARMUP_HOURS     = float(os.getenv("INDICATOR_WARMUP_HOURS", "6"))
+MAX_USERS        = int(os.getenv("INDICATOR_MAX_USERS", "100000"))
+
+
+class _UserState:
+    __slots__ = ("hr_ewma", "hrv_ewma", "spikes", "spike_count")
+
+    def __init__(self):
+        self.hr_ewma: Optional[float] = None
+        self.hrv_ewma: Optional[float] = None
+        self.spikes: Deque[bool] = deque(maxlen=SPIKE_WINDOW)
+        self.spike_count = 0
+
+    def push_spike(self, is_spike: bool) -> None:
+        if len(self.spikes) == self.spikes.maxlen and self.spikes[0]:
+            self.spike_count -= 1
+        self.spikes.append(is_spike)
+        self.spike_count += is_spike
+
+    def copy(self) -> "_UserState":
+        c = _UserState()
+        c.hr_ewma, c.hrv_ewma, c.spike_count = self.hr_ewma, self.hrv_ewma, self.spike_count
+        c.spikes = self.spikes.copy()
+        return c
+
+    def observe(self, hr: Optional[float], hrv: Optional[float], alpha: float,
+                spike_threshold: float) -> Optional[float]:
+        """Advance the EWMAs and the spike buffer; returns the HRV baseline before ``hrv``."""
+        if hr is not None:
+            # ה-spike נמדד מול ה-baseline שלפני הדגימה הנוכחית
+            if self.hr_ewma is not None:
+                self.push_spike(hr > self.hr_ewma * (1 + spike_threshold))
+            self.hr_ewma = _ewma(self.hr_ewma, hr, alpha)
+        hrv_base = self.hrv_ewma
+        if hrv is not None:
+            self.hrv_ewma = _ewma(self.hrv_ewma, hrv, alpha)
+        return hrv_base
+
+
+def _ewma(prev: Optional[float], value: float, alpha: float) -> float:
+    return value if prev is None else prev + alpha * (value - prev)
+
+
+def new_state() -> Dict[str, Any]:
+    """Staged indicator state for one transaction: working copies and the readings to replay."""
+    return {"users": {}, "observed": []}
+
+
+class IndicatorEngine:
+    """Per-user streaming indicators fed by the ingestion path."""
+
+    def __init__(self, alpha: float = BASELINE_ALPHA, spike_threshold: float = SPIKE_THRESHOLD,
+                 max_users: int = MAX_USERS):
+        self.alpha = alpha
+        self.spike_threshold = spike_threshold
+        self.max_users = max_users
+        self._users: "OrderedDict[str, _UserState]" = OrderedDict()
+        # ingest רץ גם ב-threadpool (נתיבי sync) וגם ב-writer של ה-WebSocket
+        self._lock = threading.Lock()
+
+    def _state(self, user_id: str) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState()
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def _staged(self, user_id: str, pending: Dict[str, Any]) -> _UserState:
+        st = pending["users"].get(user_id)
+        if st is None:
+            with self._lock:
+                cur = self._users.get(user_id)
+                st = cur.copy() if cur is not None else _UserState()
+            pending["users"][user_id] = st
+        return st
+
+    def update(self, row: Dict[str, Any], pending: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Advance the user's state with ``row`` and fill missing indicators in place.
+
+        Values the device did send are kept as-is; the engine only computes
+        the ones that are ``None``. With ``pending`` (``new_state()``) only the
+        staged copy advances; ``commit_state`` makes it current.
+        """
+        user_id = row.get("user_id")
+        if user_id is None:
+            return row
+        hr, hrv = row.get("heart_rate"), row.get("hrv_ms")
+
+        if pending is None:
+            with self._lock:
+                st = self._state(user_id)
+                hrv_base = st.observe(hr, hrv, self.alpha, self.spike_threshold)
+                hr_base, spikes, n = st.hr_ewma, st.spike_count, len(st.spikes)
+        else:
+            st = self._staged(user_id, pending)
+            hrv_base = st.observe(hr, hrv, self.alpha, self.spike_threshold)
+            hr_base, spikes, n = st.hr_ewma, st.spike_count, len(st.spikes)
+            pending["observed"].append((user_id, hr, hrv))
+
+        if row.get("hr_baseline") is None and hr_base is not None:
+            row["hr_baseline"] = int(round(hr_base))
+        if row.get("hr_spike_rate") is None and n:
+            row["hr_spike_rate"] = spikes / n
+        if row.get("hrv_drop_percent") is None and hrv is not None and hrv_base:
+            row["hrv_drop_percent"] = max(0.0, (hrv_base - hrv) / hrv_base * 100)
+        return row
+
+    def update_many(self, rows: Iterable[Dict[str, Any]],
+                    pending: Optional[Dict[str, Any]] = None) -> None:
+        for row in rows:
+            self.update(row, pending)
+
+    def apply(self, db: Session, rows: Iterable[Dict[str, Any]]) -> None:
+        """Fill ``rows`` from state staged on ``db``; the engine advances after commit."""
+        # כמה batches יכולים לחלוק commit אחד – כולם ממשיכים מאותו עותק
+        self.update_many(rows, db.info.setdefault("pending_indicator_state", new_state()))
+
+    def commit_state(self, pending: Dict[str, Any]) -> None:
+        """Replay a committed transaction's readings onto the engine's state."""
+        # replay ולא החלפת העותקים – טרנזקציה מקבילה של אותו משתמש לא נדרסת
+        with self._lock:
+            for user_id, hr, hrv in pending["observed"]:
+                self._state(user_id).observe(hr, hrv, self.alpha, self.spike_threshold)
+
+    def observe(self, user_id: str, hr: Optional[float], hrv: Optional[float]) -> None:
+        """Advance the user's state only – nothing is filled in or returned."""
+        with self._lock:
+            self._state(user_id).observe(hr, hrv, self.alpha, self.spike_threshold)
+
+    def warm_up(self, db: Session, hours: float = WARMUP_HOURS) -> int:
+        """Rebuild state from the last ``hours`` of ``sensor_readings`` (run on startup)."""
+        since = datetime.utcnow() - timedelta(hours=hours)
+        stmt = (
+            select(SensorReading.user_id, SensorReading.heart_rate, SensorReading.hrv_ms)
+            .where(SensorReading.timestamp >= since)
+            .order_by(SensorReading.timestamp, SensorReading.id)
+            .execution_options(yield_per=10_000)
+        )
+        n = 0
+        for user_id, hr, hrv in db.execute(stmt):
+            # שורות היסטוריות – מעדכנים מצב בלבד, לא כותבים שום דבר חזרה
+            self.observe(user_id, hr, hrv)
+            n += 1
+        log.info("Indicator state rebuilt from %d readings (%d users)", n, len(self._users))
+        return n
+
+
+indicator_engine = IndicatorEngine()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _commit_indicator_state(session: Session) -> None:
+    pending = session.info.pop("pending_indicator_state", None)
+    if pending:
+        indicator_engine.commit_state(pending)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_indicator_state(session: Session) -> None:
+    session.info.pop("pending_indicator_state", None)
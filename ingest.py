@@ -0,0 +1,194 @@
+"""ingest.py – write path for **SensorReading** rows
+---------------------------------------------------
+Everything that turns validated sensor payloads into ``sensor_readings`` rows
+lives here, so the single-reading route, the batch route and any streaming
+ingestion share one normalisation step and one insert statement.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from model import SensorReading, SessionLocal
+from alerts import alert_engine
+from indicators import indicator_engine
+from live import live_store
+from rollup import apply_rollups
+from stress import apply_stress_levels
+
+log = logging.getLogger("ingest")
+
+# עמודות הטבלה (ללא id) – כל שורה מקבלת את כל המפתחות כדי שה-INSERT ירוץ כ-executemany אחד
+READING_COLUMNS = [c.name for c in SensorReading.__table__.columns if c.name != "id"]
+
+MAX_BATCH_READINGS = 5000
+
+# write-behind של ה-WebSocket: גודל תור, גודל קבוצה וזמן המתנה מקסימלי לפני commit
+STREAM_QUEUE_SIZE = int(os.getenv("READINGS_QUEUE_SIZE", "10000"))
+STREAM_BATCH_SIZE = int(os.getenv("READINGS_BATCH_SIZE", "500"))
+STREAM_FLUSH_MS   = int(os.getenv("READINGS_FLUSH_MS", "50"))
+
+_STOP = object()     # סימן עצירה בתור – ה-writer מסיים את הקבוצה הנוכחית ויוצא
+
+
+def normalise_reading(reading) -> Dict[str, Any]:
+    """``SensorReadingCreate`` → dict ready for ``SensorReading``.
+
+    ``heart_rate_bpm`` is an alias sent by some watches; it is used only when
+    ``heart_rate`` itself is missing and is never passed to the ORM.
+    """
+    data = reading.model_dump(by_alias=True, exclude_unset=True)
+    bpm = data.pop("heart_rate_bpm", None)
+    if data.get("heart_rate") is None and bpm is not None:
+        data["heart_rate"] = bpm
+    return data
+
+
+def insert_readings(db: Session, rows: List[Dict[str, Any]]) -> List[int]:
+    """Insert ``rows`` in a single statement and return their ids in order.
+
+    Missing HR baseline / spike rate / HRV drop and ``stress_level`` are filled
+    in on ``rows`` first. The 1m/1h rollups and any alert ``Event`` rows are
+    written in the same transaction; alert pushes go out after it commits. The
+    caller owns the transaction (``db.commit()``), so several batches can share
+    one commit.
+    """
+    if not rows:
+        return []
+    indicator_engine.apply(db, rows)
+    apply_stress_levels(rows)
+    params = [{c: row.get(c) for c in READING_COLUMNS} for row in rows]
+    result = db.execute(
+        insert(SensorReading).returning(SensorReading.id, sort_by_parameter_order=True),
+        params,
+    )
+    ids = [r[0] for r in result]
+    apply_rollups(db, params)
+    alert_engine.apply(db, params)
+    return ids
+
+
+def publish_readings(rows: List[Dict[str, Any]], ids: List[int]) -> None:
+    """Post-commit fan-out of freshly stored readings (in-memory live cache)."""
+    live_store.push_many(rows, ids)
+
+
+# ───────────────────────────── write-behind writer ─────────────────────────────
+class ReadingWriter:
+    """Bounded in-process queue flushed to ``sensor_readings`` in group commits.
+
+    ``submit`` returns a future that resolves to the row id once the group it
+    landed in is committed. A group is flushed when it reaches ``batch_size``
+    rows or ``flush_ms`` after its first row, whichever comes first. When the
+    queue is full ``submit`` waits, which pushes back on the sending socket.
+    """
+
+    def __init__(self, max_queue: int = STREAM_QUEUE_SIZE,
+                 batch_size: int = STREAM_BATCH_SIZE, flush_ms: int = STREAM_FLUSH_MS):
+        self.max_queue  = max_queue
+        self.batch_size = batch_size
+        self.flush_s    = flush_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Commit everything submitted so far, then stop the writer."""
+        if self._task is None:
+            return
+        await self.queue.put(_STOP)
+        try:
+            await self._task
+        finally:
+            self._task = None
+        # שורות שנכנסו לתור אחרי סימן העצירה
+        pending = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not _STOP:
+                pending.append(item)
+        if pending:
+            await self._flush(pending)
+
+    async def submit(self, row: Dict[str, Any]) -> "asyncio.Future[int]":
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((row, fut))
+        return fut
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        batch: List[Tuple[Dict[str, Any], "asyncio.Future[int]"]] = []
+        try:
+            while True:
+                item = await self.queue.get()
+                if item is _STOP:
+                    return
+                batch = [item]
+                stopping = False
+                deadline = loop.time() + self.flush_s
+                while len(batch) < self.batch_size:
+                    if not self.queue.empty():
+                        item = self.queue.get_nowait()
+                    else:
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            item = await asyncio.wait_for(self.queue.get(), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                await self._flush(batch)
+                batch = []
+                if stopping:
+                    return
+        finally:
+            # ה-task בוטל באמצע איסוף קבוצה – השורות שכבר נאספו לא ייכתבו
+            _fail(batch, RuntimeError("reading writer stopped before commit"))
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], "asyncio.Future[int]"]]) -> None:
+        ids: List[int] = []
+        error: BaseException = RuntimeError("reading writer stopped before commit")
+        try:
+            ids = await asyncio.to_thread(self._write, [row for row, _ in batch])
+            log.debug("Group commit: %d readings", len(ids))
+        except Exception as e:
+            log.exception("Group commit of %d readings failed", len(batch))
+            error = e
+        finally:
+            # גם ב-CancelledError – כל future מקבל id או חריגה
+            for (_, fut), reading_id in zip(batch, ids):
+                if not fut.done():
+                    fut.set_result(reading_id)
+            _fail(batch, error)
+
+    @staticmethod
+    def _write(rows: List[Dict[str, Any]]) -> List[int]:
+        db = SessionLocal()
+        try:
+            ids = insert_readings(db, rows)
+            db.commit()
+            publish_readings(rows, ids)
+            return ids
+        finally:
+            db.close()
+
+
+def _fail(batch: List[Tuple[Dict[str, Any], "asyncio.Future[int]"]], error: BaseException) -> None:
+    for _, fut in batch:
+        if not fut.done():
+            fut.set_exception(error)
+
+
+reading_writer = ReadingWriter()
@@ -0,0 +1,122 @@
+"""live.py – in-process hot cache of each user's latest readings
+---------------------------------------------------------------
+The app and the caregiver dashboard mostly ask "what is this user's state now
+and over the last few minutes". ``LiveStore`` answers that from memory: every
+user gets a fixed-size ring of NumPy rows (one float32 column per indicator),
+so memory per user is bounded and a read is a couple of array slices.
+
+It is fed after commit by the ingestion path and is not a source of truth:
+after a restart it starts empty and refills as readings arrive.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+LIVE_FIELDS = (
+    "heart_rate", "hrv_ms", "acceleration", "skin_temp_c", "ambient_temp_c",
+    "spo2_percent", "eda_microsiemens", "hr_baseline", "hr_spike_rate",
+    "hrv_drop_percent", "rage_probability",
+)
+# שדות טקסט – נשמר רק הערך האחרון
+LIVE_LABELS = ("device_id", "alert_level", "stress_level")
+
+LIVE_CAPACITY  = int(os.getenv("LIVE_CAPACITY", "600"))       # ~10 דקות ב-1Hz
+LIVE_MAX_USERS = int(os.getenv("LIVE_MAX_USERS", "50000"))
+
+
+def _epoch(ts) -> float:
+    if ts is None:
+        return datetime.now(timezone.utc).timestamp()
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class _Ring:
+    __slots__ = ("ts", "values", "ids", "head", "size", "labels")
+
+    def __init__(self, capacity: int):
+        self.ts     = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((capacity, len(LIVE_FIELDS)), np.nan, dtype=np.float32)
+        self.ids    = np.zeros(capacity, dtype=np.int64)
+        self.head   = 0
+        self.size   = 0
+        self.labels: Dict[str, Optional[str]] = {}
+
+    def push(self, reading_id: int, ts: float, row: Dict[str, Any]) -> None:
+        i = self.head
+        self.ts[i] = ts
+        self.ids[i] = reading_id
+        self.values[i] = [np.nan if row.get(f) is None else row[f] for f in LIVE_FIELDS]
+        cap = self.ts.shape[0]
+        self.head = (i + 1) % cap
+        self.size = min(self.size + 1, cap)
+        for name in LIVE_LABELS:
+            if row.get(name) is not None:
+                self.labels[name] = row[name]
+
+    def order(self) -> np.ndarray:
+        """Physical indices from oldest to newest."""
+        cap = self.ts.shape[0]
+        return (self.head - self.size + np.arange(self.size)) % cap
+
+
+def _cell(v) -> Optional[float]:
+    return None if np.isnan(v) else float(v)
+
+
+class LiveStore:
+    """Per-user ring buffers with LRU eviction of idle users."""
+
+    def __init__(self, capacity: int = LIVE_CAPACITY, max_users: int = LIVE_MAX_USERS):
+        self.capacity = capacity
+        self.max_users = max_users
+        self._rings: "OrderedDict[str, _Ring]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def push_many(self, rows: Iterable[Dict[str, Any]], ids: Iterable[int]) -> None:
+        with self._lock:
+            for row, reading_id in zip(rows, ids):
+                user_id = row.get("user_id")
+                if user_id is None:
+                    continue
+                ring = self._rings.get(user_id)
+                if ring is None:
+                    ring = self._rings[user_id] = _Ring(self.capacity)
+                    if len(self._rings) > self.max_users:
+                        self._rings.popitem(last=False)
+                else:
+                    self._rings.move_to_end(user_id)
+                ring.push(reading_id, _epoch(row.get("timestamp")), row)
+
+    def snapshot(self, user_id: str, window_s: float = 300) -> Optional[Dict[str, Any]]:
+        """Latest reading plus the columns of the last ``window_s`` seconds, or ``None``."""
+        with self._lock:
+            ring = self._rings.get(user_id)
+            if ring is None or ring.size == 0:
+                return None
+            idx = ring.order()
+            ts, values, ids = ring.ts[idx], ring.values[idx], ring.ids[idx]
+            labels = dict(ring.labels)
+
+        keep = ts >= ts[-1] - window_s
+        ts, values, ids = ts[keep], values[keep], ids[keep]
+        latest = {f: _cell(v) for f, v in zip(LIVE_FIELDS, values[-1])}
+        latest.update(labels, id=int(ids[-1]),
+                      timestamp=datetime.fromtimestamp(ts[-1], timezone.utc))
+        # חלון כעמודות; זמנים כ-epoch seconds כדי לחסוך המרה לכל תא
+        window: Dict[str, List[Any]] = {"ts": ts.tolist()}
+        for j, f in enumerate(LIVE_FIELDS):
+            col = values[:, j]
+            cells = col.astype(object)
+            cells[np.isnan(col)] = None
+            window[f] = cells.tolist()
+        return {"user_id": user_id, "latest": latest, "window": window}
+
+
+live_store = LiveStore()
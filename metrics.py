@@ -0,0 +1,283 @@
+"""metrics.py – in-process Prometheus-style metrics
+--------------------------------------------------
+A small registry rendered in the Prometheus text format on ``GET /metrics``.
+
+Recording has to stay cheap on hot paths, so counters and histograms are
+sharded per thread: each thread (the event loop, every threadpool worker)
+writes only to its own dict, and the lock is taken once per thread, when the
+shard is created. A scrape sums the shards. Gauges are plain values behind a
+lock because they change rarely.
+
+Instrumentation helpers:
+• ``MetricsMiddleware`` – request latency per route template / method / status.
+• ``instrument_engine`` – SQLAlchemy statement counts and durations.
+• the metric objects below, used directly by the proxy, TTS/STT and FCM code.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _Sharded(_Metric):
+    """Per-thread storage; only shard creation takes the lock."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _snapshots(self) -> Iterable[dict]:
+        with self._lock:
+            shards = list(self._shards)
+        return [s.copy() for s in shards]
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        totals: Dict[tuple, float] = {}
+        for snap in self._snapshots():
+            for key, v in snap.items():
+                totals[key] = totals.get(key, 0) + v
+        lines = super().render()
+        lines += [f"{self.name}{_labels_text(self.labelnames, k)} {v}" for k, v in sorted(totals.items())]
+        return lines
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        cell = shard.get(key)
+        if cell is None:
+            # [count per bucket..., +Inf, sum]
+            cell = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        totals: Dict[tuple, list] = {}
+        for snap in self._snapshots():
+            for key, cell in snap.items():
+                acc = totals.setdefault(key, [0] * len(cell))
+                for i, v in enumerate(list(cell)):
+                    acc[i] += v
+        lines = super().render()
+        for key, cell in sorted(totals.items()):
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), cell[:-1]):
+                running += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {cell[-1]}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {running}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "start")
+
+    def __init__(self, hist: Histogram, labels: dict):
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        self.fn = fn                    # ערך שנקרא בזמן ה-scrape (עומק תורים וכו')
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        if self.fn is not None:
+            lines.append(f"{self.name} {self.fn()}")
+            return lines
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels_text(self.labelnames, k)} {v}" for k, v in items]
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ───────────────────────────────── metrics ─────────────────────────────────────
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+DB_QUERY_LATENCY = REGISTRY.histogram(
+    "db_query_duration_seconds", "SQLAlchemy statement duration", ("operation",))
+REALTIME_SESSIONS = REGISTRY.gauge(
+    "realtime_active_sessions", "Open /v1/realtime WebSocket sessions")
+REALTIME_AUDIO_BYTES = REGISTRY.counter(
+    "realtime_audio_bytes_total", "Decoded audio bytes relayed by the realtime proxy", ("direction",))
+REALTIME_SLOW_CLIENT = REGISTRY.counter(
+    "realtime_slow_client_total", "Slow-client policy actions on the outbound audio queue", ("action",))
+REALTIME_SENSOR = REGISTRY.counter(
+    "realtime_sensor_messages_total", "Sensor messages by gate outcome (absorbed, deferred, prompted, superseded)",
+    ("outcome",))
+OPENAI_LATENCY = REGISTRY.histogram(
+    "openai_upstream_latency_seconds", "OpenAI realtime upstream latency", ("stage",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0))
+UPSTREAM_POOL_ACQUIRE = REGISTRY.counter(
+    "openai_pool_acquire_total", "Upstream connections taken from the warm pool (hit) or opened on demand (miss)",
+    ("outcome",))
+TTS_LATENCY = REGISTRY.histogram(
+    "tts_duration_seconds", "Edge-TTS synthesis duration", buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+TTS_FIRST_CHUNK_LATENCY = REGISTRY.histogram(
+    "tts_first_chunk_seconds", "Edge-TTS time to first audio chunk", buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0))
+TTS_CACHE = REGISTRY.counter(
+    "tts_cache_total", "TTS cache lookups by outcome (memory, disk, shared, miss)", ("outcome",))
+STT_LATENCY = REGISTRY.histogram(
+    "stt_duration_seconds", "Speech-to-text duration", buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+FCM_SENDS = REGISTRY.counter(
+    "fcm_send_total", "FCM send outcomes", ("outcome",))
+
+
+# ──────────────────────────────── instrumentation ──────────────────────────────
+class MetricsMiddleware:
+    """ASGI middleware recording ``http_request_duration_seconds``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(msg):
+            nonlocal status
+            if msg["type"] == "http.response.start":
+                status = msg["status"]
+            await send(msg)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # תבנית ה-route ולא ה-path עצמו – אחרת כל id יוצר סדרה חדשה
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - start,
+                                 method=scope["method"], route=route, status=status)
+
+
+def instrument_engine(engine) -> None:
+    """Time every cursor execution on ``engine`` (a sync ``Engine`` / ``AsyncEngine.sync_engine``)."""
+
+    # זמן ההתחלה נשמר על ה-execution context של ההרצה עצמה – הרצה שנכשלה לא משאירה
+    # ערך יתום שישבש את המדידות הבאות על אותו חיבור
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is not None:
+            op = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+            DB_QUERY_LATENCY.observe(time.perf_counter() - start, operation=op)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""mock_realtime.py – local stand-in for the OpenAI Realtime API
+----------------------------------------------------------------
+Lets the OpenAI path of ``openAI.Proxy`` run without network or a key, so it
+can be tested and profiled deterministically. Point the proxy at it with
+``OPENAI_REALTIME_URL=ws://127.0.0.1:9001``.
+
+Three modes:
+
+serve   Synthetic upstream. Accepts ``session.update``,
+        ``input_audio_buffer.append/commit``, ``conversation.item.create``,
+        ``response.create`` and ``response.cancel``, and answers each response
+        with ``response.text.delta`` / ``response.audio.delta`` (base64 PCM16,
+        24 kHz) followed by the done events – the subset ``_from_openai``
+        handles. Like the real API, one response runs at a time: a second
+        ``response.create`` gets ``conversation_already_has_active_response``,
+        and ``response.cancel`` stops the running one with
+        ``response.done`` / ``status: "cancelled"``. First-delta latency,
+        delta sizes and pacing are configurable.
+record  Transparent relay to the real API that writes every message in both
+        directions, with its offset in seconds, to a JSONL file.
+replay  Plays a recorded session back to each connecting client. Upstream
+        events are grouped by the ``response.create`` that preceded them and
+        re-sent with their original timing once the client sends its own
+        ``response.create``.
+
+    python mock_realtime.py serve --first-delta-ms 300 --chunk-ms 40
+    python mock_realtime.py record --out session.jsonl
+    python mock_realtime.py replay session.jsonl
+
+dependencies: pip install "websockets>=14"
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import math
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import websockets
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
+log = logging.getLogger("rt-mock")
+
+SAMPLE_RATE = 24000       # PCM16 של ה-Realtime API
+# כמו openAI.DEFAULT_REALTIME_URL – בלי לייבא את כל שרשרת ה-TTS/STT
+DEFAULT_REALTIME_URL = "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01"
+
+
+def _tone(seconds: float, sample_rate: int = SAMPLE_RATE) -> bytes:
+    n = int(seconds * sample_rate)
+    out = bytearray()
+    for i in range(n):
+        out += int(6000 * math.sin(2 * math.pi * 330 * i / sample_rate)).to_bytes(2, "little", signed=True)
+    return bytes(out)
+
+
+def _summary(evt: dict) -> str:
+    """Event type plus payload length – never the payload itself."""
+    for key in ("audio", "delta"):
+        if isinstance(evt.get(key), str) and len(evt[key]) > 64:
+            return f"{evt.get('type')} ({key} len={len(evt[key])})"
+    return str(evt.get("type"))
+
+
+async def _error(ws, code: Optional[str], message: str, event_id: Optional[str]) -> None:
+    err = {"type": "invalid_request_error", "code": code, "message": message, "event_id": event_id}
+    await ws.send(json.dumps({"type": "error", "error": {k: v for k, v in err.items() if v is not None}}))
+
+
+# ---------- serve ------------------------------------------------------------
+class MockUpstream:
+    def __init__(self, reply_text: str, reply_seconds: float, first_delta_ms: float,
+                 chunk_ms: float, interval_ms: float, text_words: int):
+        self.reply_words = reply_text.split()
+        self.first_delta = first_delta_ms / 1000
+        self.interval = interval_ms / 1000
+        self.text_words = max(1, text_words)
+        chunk_bytes = max(2, int(SAMPLE_RATE * chunk_ms / 1000) * 2)
+        audio = _tone(reply_seconds)
+        # ה-deltas מקודדים מראש – ה-mock עצמו לא אמור להופיע בפרופיל
+        self.audio_deltas = [base64.b64encode(audio[i:i + chunk_bytes]).decode()
+                             for i in range(0, len(audio), chunk_bytes)]
+
+    async def handler(self, ws, path=None):
+        try:
+            await self._serve(ws)
+        except websockets.ConnectionClosed:
+            pass                # הלקוח (למשל ה-pool) סגר באמצע – לא שגיאה של ה-mock
+
+    async def _serve(self, ws) -> None:
+        audio_in = 0
+        responses = 0
+        # התשובה רצה כ-task – כך response.cancel מגיע אליה באמצע
+        active: Optional[asyncio.Task] = None
+        active_id = None
+        await ws.send(json.dumps({"type": "session.created", "session": {}}))
+        try:
+            async for raw in ws:
+                evt = json.loads(raw)
+                typ = evt.get("type")
+                if typ == "session.update":
+                    await ws.send(json.dumps({"type": "session.updated", "session": evt.get("session", {})}))
+                elif typ == "input_audio_buffer.append":
+                    audio_in += len(evt.get("audio", "")) * 3 // 4
+                elif typ == "input_audio_buffer.commit":
+                    await ws.send(json.dumps({"type": "input_audio_buffer.committed", "bytes": audio_in}))
+                    audio_in = 0
+                elif typ == "conversation.item.create":
+                    await ws.send(json.dumps({"type": "conversation.item.created", "item": evt.get("item", {})}))
+                elif typ == "response.create":
+                    if active is not None and not active.done():
+                        await _error(ws, "conversation_already_has_active_response",
+                                     f"Conversation already has an active response ({active_id})",
+                                     evt.get("event_id"))
+                        continue
+                    responses += 1
+                    active_id = f"resp_{responses}"
+                    modalities = (evt.get("response") or {}).get("modalities") or ["text", "audio"]
+                    await ws.send(json.dumps({"type": "response.created", "response": {"id": active_id}}))
+                    active = asyncio.create_task(self.respond(ws, active_id, modalities))
+                elif typ == "response.cancel":
+                    # cancel() מחזיר False אם התשובה כבר הסתיימה (ו-response.done כבר נשלח)
+                    if active is None or not active.cancel():
+                        await _error(ws, "response_cancel_not_active", "There is no active response to cancel",
+                                     evt.get("event_id"))
+                        continue
+                    await asyncio.gather(active, return_exceptions=True)
+                    await ws.send(json.dumps({"type": "response.done",
+                                              "response": {"id": active_id, "status": "cancelled"}}))
+                else:
+                    await _error(ws, None, f"unsupported event {typ!r}", evt.get("event_id"))
+        finally:
+            if active is not None:
+                active.cancel()
+
+    async def respond(self, ws, response_id: str, modalities: List[str]) -> None:
+        """Deltas and done events of a response already announced with ``response.created``."""
+        await asyncio.sleep(self.first_delta)
+        if "text" in modalities:
+            for i in range(0, len(self.reply_words), self.text_words):
+                chunk = " ".join(self.reply_words[i:i + self.text_words])
+                await ws.send(json.dumps({"type": "response.text.delta", "response_id": response_id,
+                                          "delta": chunk if i == 0 else " " + chunk}))
+            await ws.send(json.dumps({"type": "response.text.done", "response_id": response_id,
+                                      "text": " ".join(self.reply_words)}))
+        if "audio" in modalities:
+            for delta in self.audio_deltas:
+                await ws.send(json.dumps({"type": "response.audio.delta", "response_id": response_id,
+                                          "delta": delta}))
+                if self.interval:
+                    await asyncio.sleep(self.interval)
+            await ws.send(json.dumps({"type": "response.audio.done", "response_id": response_id}))
+        await ws.send(json.dumps({"type": "response.done", "response": {"id": response_id,
+                                                                        "status": "completed"}}))
+
+
+# ---------- record -----------------------------------------------------------
+class Recorder:
+    """Relay to the real API, logging ``{"t", "dir", "event"}`` lines (dir: client / server)."""
+
+    def __init__(self, url: str, key: Optional[str], out: Path):
+        self.url, self.key, self.out = url, key, out
+        self.sessions = 0
+
+    async def handler(self, ws, path=None):
+        self.sessions += 1
+        out = self.out if self.sessions == 1 else \
+            self.out.with_name(f"{self.out.stem}.{self.sessions}{self.out.suffix}")
+        headers = {"OpenAI-Beta": "realtime=v1"}
+        if self.key:
+            headers["Authorization"] = f"Bearer {self.key}"
+        t0 = time.perf_counter()
+        async with websockets.connect(self.url, additional_headers=headers, max_size=None) as upstream:
+            with out.open("w", encoding="utf-8") as f:
+                def write(direction: str, raw) -> None:
+                    f.write(json.dumps({"t": round(time.perf_counter() - t0, 4), "dir": direction,
+                                        "event": json.loads(raw)}) + "\n")
+
+                async def pump(src, dst, direction):
+                    async for raw in src:
+                        write(direction, raw)
+                        log.debug("%s %s", direction, _summary(json.loads(raw)))
+                        await dst.send(raw)
+
+                tasks = [asyncio.create_task(pump(ws, upstream, "client")),
+                         asyncio.create_task(pump(upstream, ws, "server"))]
+                try:
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for t in tasks:
+                        t.cancel()
+        log.info("Recorded session → %s", out)
+
+
+# ---------- replay -----------------------------------------------------------
+class Replayer:
+    def __init__(self, path: Path, speed: float = 1.0):
+        self.speed = speed
+        lines = [json.loads(l) for l in path.read_text(encoding="utf-8").splitlines() if l.strip()]
+        # turns[0] – אירועים לפני ה-response.create הראשון (session.created וכו');
+        # turns[n] – כל מה שהשרת שלח אחרי ה-response.create ה-n, עם offset יחסי אליו
+        self.turns: List[List[tuple]] = [[]]
+        anchor = 0.0
+        for line in lines:
+            if line["dir"] == "client" and line["event"].get("type") == "response.create":
+                self.turns.append([])
+                anchor = line["t"]
+            elif line["dir"] == "server":
+                self.turns[-1].append((line["t"] - anchor, json.dumps(line["event"])))
+        log.info("Loaded %d recorded responses from %s", len(self.turns) - 1, path)
+
+    async def _play(self, ws, events: List[tuple]) -> None:
+        start = time.perf_counter()
+        for offset, raw in events:
+            delay = offset / self.speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await ws.send(raw)
+
+    async def handler(self, ws, path=None):
+        await self._play(ws, self.turns[0])
+        turn = 0
+        playing: Optional[asyncio.Task] = None
+        try:
+            async for raw in ws:
+                if json.loads(raw).get("type") != "response.create":
+                    continue
+                turn += 1
+                if turn >= len(self.turns):
+                    await ws.send(json.dumps({"type": "error",
+                                              "error": {"message": "recording has no more responses"}}))
+                    continue
+                if playing:
+                    await playing
+                playing = asyncio.create_task(self._play(ws, self.turns[turn]))
+        finally:
+            if playing:
+                playing.cancel()
+
+
+async def run(args) -> None:
+    if args.mode == "serve":
+        handler = MockUpstream(args.reply_text, args.reply_seconds, args.first_delta_ms,
+                               args.chunk_ms, args.interval_ms, args.text_words).handler
+    elif args.mode == "record":
+        handler = Recorder(args.upstream, os.getenv("OPENAI_API_KEY"), Path(args.out)).handler
+    else:
+        handler = Replayer(Path(args.recording), args.speed).handler
+    async with websockets.serve(handler, args.host, args.port, max_size=None):
+        log.info("%s mode on ws://%s:%d (set OPENAI_REALTIME_URL to this)", args.mode, args.host, args.port)
+        await asyncio.Future()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Local stand-in for the OpenAI Realtime API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9001)
+    sub = ap.add_subparsers(dest="mode", required=True)
+
+    s = sub.add_parser("serve", help="synthetic responses")
+    s.add_argument("--reply-text", default="Take a deep breath. You are doing fine.")
+    s.add_argument("--reply-seconds", type=float, default=2.0, help="audio length per response")
+    s.add_argument("--first-delta-ms", type=float, default=250, help="latency before the first delta")
+    s.add_argument("--chunk-ms", type=float, default=50, help="audio per response.audio.delta")
+    s.add_argument("--interval-ms", type=float, default=0, help="pause between audio deltas")
+    s.add_argument("--text-words", type=int, default=2, help="words per response.text.delta")
+
+    r = sub.add_parser("record", help="relay to the real API and record to JSONL")
+    r.add_argument("--upstream", default=DEFAULT_REALTIME_URL)
+    r.add_argument("--out", default="realtime_session.jsonl")
+
+    p = sub.add_parser("replay", help="replay a recorded session")
+    p.add_argument("recording")
+    p.add_argument("--speed", type=float, default=1.0, help="timing multiplier (2 = twice as fast)")
+
+    try:
+        asyncio.run(run(ap.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,66 @@
+import os
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
-from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy import create_engine, event, Column, Index, Integer, String
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 from sqlalchemy import Float, JSON, DateTime
 from datetime import datetime
 from dateutil import parser
 from pydantic import BaseModel, Field
 
-DATABASE_URL = "sqlite:///./test2.db"
-
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# ─────────────── הגדרות חיבור (ניתנות לשינוי דרך משתני סביבה) ───────────────
+DATABASE_URL       = os.getenv("DATABASE_URL", "sqlite:///./test2.db")
+# ה-URL האסינכרוני נגזר מ-DATABASE_URL. שימו לב: עם SQLite בזיכרון (sqlite:///:memory:) כל engine
+# פותח DB נפרד משלו – מה שנכתב במסלול הסינכרוני לא נראה במסלול ה-async. לשני המסלולים – קובץ.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+DB_POOL_SIZE       = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW    = int(os.getenv("DB_MAX_OVERFLOW", "16"))
+SQLITE_MMAP_BYTES  = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB    = int(os.getenv("SQLITE_CACHE_KB", str(64 * 1024)))
+SQLITE_BUSY_MS     = int(os.getenv("SQLITE_BUSY_MS", "5000"))
+
+
+def _engine_kwargs(url: str, queue_pool) -> dict:
+    """Pool settings for ``url``; in-memory SQLite must share one connection (per engine –
+    the sync and async engines still get separate in-memory databases)."""
+    if not url.startswith("sqlite"):
+        return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_pre_ping": True}
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    if ":memory:" in url or url.rstrip("/").endswith(":"):
+        kwargs["poolclass"] = StaticPool
+    else:
+        kwargs.update(poolclass=queue_pool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    return kwargs
+
+
+def _sqlite_pragmas(dbapi_connection, _connection_record):
+    """WAL lets readers run alongside the ingestion writer; NORMAL sync is safe under WAL."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL, QueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# מסלול אסינכרוני (aiosqlite) – לנתיבי קריאה שלא צריכים לתפוס worker ב-threadpool
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_kwargs(ASYNC_DATABASE_URL, AsyncAdaptedQueuePool))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", _sqlite_pragmas)
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
 Base = declarative_base()
 
 class User(Base):
@@ -54,6 +101,11 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 class SensorReading(Base):
     __tablename__ = "sensor_readings"
 
@@ -83,43 +135,13 @@ class SensorReading(Base):
     # שדות מורכבים (סטטוס חיישנים) – נשמר כ-JSON
     sensor_status = Column(JSON, nullable=True)
 
-class AlertData(BaseModel):
-    heart_rate: str
-    stress_level: str
-    status_message: str
-    alert_type: str
-    alert_message: str
-
-class AlertRequest(BaseModel):
-    data: AlertData
-
-@app.post("/send_alert")
-async def send_alert(request: AlertRequest):
-    alert = request.data
-    device_token = request.token
-
-    # 1) לוג ל-console
-    print(f"[ALERT RECEIVED] type={alert.alert_type} message={alert.alert_message}")
-
-    # 2) בניית הודעת FCM
-    # פה נשלח לכל המכשירים שנרשמו לנושא "alerts"
-    message = messaging.Message(
-        notification=messaging.Notification(
-            title=f"Alert: {alert.alert_type.capitalize()}",
-            body=alert.alert_message
-        ),
-        data=alert.dict(),           # שולח גם את כל השדות כ־data payload
-        token=device_token               # או שתשנו ל־token=<DEVICE_TOKEN> אם אתם שולחים למכשיר ספציפי
-    )
-
-    # 3) שליחה ל־FCM
-    try:
-        response = messaging.send(message)
-        return {"success": True, "message_id": response}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"FCM send failed: {e}")
+    # שאילתות טווח-זמן לפי משתמש (דשבורדים) – אינדקס מורכב
+    __table_args__ = (Index("ix_sensor_readings_user_ts", "user_id", "timestamp"),)
 
 Base.metadata.create_all(bind=engine)
+# create_all לא מוסיף אינדקסים לטבלה שכבר קיימת
+for _index in SensorReading.__table__.indexes:
+    _index.create(bind=engine, checkfirst=True)
 
 
 
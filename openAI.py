@@ -7,101 +7,262 @@ pip install fastapi uvicorn websockets edge-tts SpeechRecognition pipwin
 pipwin install pyaudio      # Windows בלבד ל-SpeechRecognition
 """
 
-import asyncio, base64, json, os, logging, tempfile
+import asyncio, base64, binascii, json, os, logging, time
 from typing import Dict, Any
 
-from fastapi import UploadFile, File, HTTPException
-import tempfile, base64, os
-
 import websockets                             # משמש רק עם OpenAI-Key
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 # ─────────────── ייבוא הקבצים החדשים ────────────────
-from tts import text_to_speech        # async text→MP3
-from stt import speech_to_text        # file→text
+from tts_cache import tts_cache, warm_phrases   # async text→MP3, עם cache
+from stt import STT_SAMPLE_RATE, SttBusy, is_audio_file, stt_pool   # bytes→text, מחוץ ל-event loop
+from vad import VAD_AUTO_COMMIT, VAD_ENABLED, VoiceActivityDetector
+import audio_frames
+from outbound import ClientSender
+from upstream_pool import UPSTREAM_POOL_SIZE, UpstreamPool
+from sensor_gate import SensorGate
+from metrics import (OPENAI_LATENCY, REALTIME_AUDIO_BYTES, REALTIME_SENSOR, REALTIME_SESSIONS,
+                     STT_LATENCY, TTS_FIRST_CHUNK_LATENCY, TTS_LATENCY)
 # ─────────────────────────────────────────────────────
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
 log = logging.getLogger("rt-proxy")
 
+# ברירת המחדל – ה-API האמיתי; mock_realtime.py מאזין מקומית לבדיקות/פרופיילינג
+DEFAULT_REALTIME_URL = "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01"
+OPENAI_REALTIME_URL  = os.getenv("OPENAI_REALTIME_URL", DEFAULT_REALTIME_URL)
+
 app = FastAPI(title="Realtime Audio Proxy")
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True,
                    allow_methods=["*"], allow_headers=["*"])
 
-# ═══════════════  עטיפות TTS/STT בסיס-64  ═══════════════
-async def tts_mp3_b64(text: str) -> str:
-    """text_to_speech → base64-MP3"""
-    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
-        out_path = tmp.name
-    await text_to_speech(text, out_path)      # הפונקציה מה-tts.py
-    mp3_bytes = open(out_path, "rb").read()
-    os.remove(out_path)
-    return base64.b64encode(mp3_bytes).decode()
-
-def stt_b64_to_text(b64_wav: str, lang="en-US") -> str:
-    """base64-WAV → speech_to_text()"""
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-        tmp.write(base64.b64decode(b64_wav)); tmp.flush()
-        text = speech_to_text(tmp.name, lang=lang)
-    os.remove(tmp.name)
-    return text
-# ═══════════════════════════════════════════════════════
-
-def compute_stress(s: Dict[str, Any]) -> float:
-    rage = s.get("rage_probability", 0)/100
-    hr   = s.get("heart_rate") or s.get("heart_rate_bpm") or 0
-    return min(1.0, 0.6*rage + 0.4*max(0, hr-75)/40)
+# OpenAI מצפה ל-PCM16 ב-24kHz; במצב מקומי – קצב ה-STT
+VAD_SAMPLE_RATE = int(os.getenv("VAD_SAMPLE_RATE", "0")) or None
+# PCM שממתין ל-STT לכל חיבור (מצב מקומי); ברירת מחדל ≈ דקה ב-16kHz
+INPUT_BUFFER_MAX_BYTES = int(os.getenv("INPUT_BUFFER_MAX_BYTES", str(2 * 1024 * 1024)))
+TTS_STREAM_MIN_CHUNK = int(os.getenv("TTS_STREAM_MIN_CHUNK", "4096"))   # bytes per audio_response
+
 
 class Proxy:
     def __init__(self):
         self.key   = os.getenv("OPENAI_API_KEY")
-        self.use_ai = bool(self.key)
-        self.buffers: dict[WebSocket, list[str]] = {}
+        self.url   = OPENAI_REALTIME_URL
+        # upstream מקומי (mock / replay) לא צריך KEY
+        self.use_ai = bool(self.key) or self.url != DEFAULT_REALTIME_URL
+        # PCM מפוענח לכל חיבור (מצב מקומי בלבד) – מפוענח chunk-chunk, לא בזמן ה-commit
+        self.buffers: dict[WebSocket, bytearray] = {}
+        # מתי נשלח response.create אחרון לכל חיבור upstream (למדידת latency עד ה-delta הראשון)
+        self.response_requested: dict[Any, float] = {}
+        # תגובות לכל חיבור upstream: "pending" – response.create שעוד לא אושר (event_id → kind),
+        # "active" – תגובות שנוצרו ועוד לא הסתיימו (response.id → kind)
+        self.responses: dict[Any, dict] = {}
+        # תור יציאה חסום לכל לקוח – ה-reader מ-OpenAI לא מחכה ללקוח איטי
+        self.senders: dict[WebSocket, ClientSender] = {}
+        self._warm_up = None
+        # חיבורי upstream מוכנים מראש; בלי pool – חיבור חדש לכל session
+        self.pool = UpstreamPool(self._connect_upstream) if self.use_ai and UPSTREAM_POOL_SIZE > 0 else None
+
+    async def start(self):
+        if self.pool:
+            self.pool.start()
+        if not self.use_ai:
+            # מצב מקומי – משפטים חוזרים מוכנים מראש; ברקע, כדי לא לעכב את ה-startup
+            self._warm_up = asyncio.create_task(tts_cache.warm_up(warm_phrases()))
+
+    async def stop(self):
+        if self.pool:
+            await self.pool.stop()
+        if self._warm_up and not self._warm_up.done():
+            self._warm_up.cancel()
+
+    async def _connect_upstream(self):
+        """Open and configure one upstream session."""
+        headers = {"OpenAI-Beta":"realtime=v1"}
+        if self.key:
+            headers["Authorization"] = f"Bearer {self.key}"
+        ai_ws = await websockets.connect(self.url, additional_headers=headers)
+        session = {"modalities":["text","audio"], "voice":"alloy"}
+        if VAD_ENABLED and VAD_AUTO_COMMIT:
+            session["turn_detection"] = None      # ה-commit מגיע מה-VAD שלנו
+        await ai_ws.send(json.dumps({"type":"session.update", "session":session}))
+        return ai_ws
 
     async def websocket_proxy(self, client: WebSocket):
-        await client.accept();   self.buffers[client] = []
-        log.info("Client connected | mode=%s", "OpenAI" if self.use_ai else "local")
+        binary = audio_frames.wants_binary(client.scope)
+        subprotocol = audio_frames.SUBPROTOCOL if audio_frames.SUBPROTOCOL in client.scope.get("subprotocols", ()) else None
+        await client.accept(subprotocol=subprotocol);   self.buffers[client] = bytearray()
+        sender = self.senders[client] = ClientSender(client, binary)
+        log.info("Client connected | mode=%s | audio=%s", "OpenAI" if self.use_ai else "local",
+                 "binary" if binary else "json")
+        REALTIME_SESSIONS.inc()
 
+        ai_ws, tasks = None, set()
         try:
-            ai_ws = None
             if self.use_ai:
-                ai_ws = await websockets.connect(
-                    "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01",
-                    extra_headers={"Authorization": f"Bearer {self.key}",
-                                   "OpenAI-Beta":"realtime=v1"})
-                await ai_ws.send(json.dumps({"type":"session.update",
-                                             "session":{"modalities":["text","audio"],
-                                                        "voice":"alloy"}}))
-            upstream   = asyncio.create_task(self._from_client(client, ai_ws))
-            downstream = asyncio.create_task(self._from_openai(ai_ws, client)) if ai_ws else None
-            await asyncio.wait({upstream, *( [downstream] if downstream else [])},
-                               return_when=asyncio.FIRST_COMPLETED)
+                t0 = time.perf_counter()
+                ai_ws = await (self.pool.acquire() if self.pool else self._connect_upstream())
+                OPENAI_LATENCY.observe(time.perf_counter() - t0, stage="connect")
+            tasks = {asyncio.create_task(self._from_client(client, ai_ws)),
+                     asyncio.create_task(sender.run())}
+            if ai_ws:
+                tasks.add(asyncio.create_task(self._from_openai(ai_ws, client)))
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
         finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await sender.wait_closed()
+            REALTIME_SESSIONS.dec()
             self.buffers.pop(client, None)
-            if ai_ws: await ai_ws.close()
+            self.senders.pop(client, None)
+            if ai_ws:
+                self.response_requested.pop(ai_ws, None)
+                self.responses.pop(ai_ws, None)
+                await ai_ws.close()
+
+    # ---------- proxy → client ----------
+    def queue_stats(self) -> list:
+        """Outbound queue depth per open session."""
+        return [s.stats() for s in list(self.senders.values())]
+
+    async def _stream_tts(self, client, text: str):
+        """Edge-TTS chunks → audio_response deltas as they arrive, then audio_response_done."""
+        t0 = time.perf_counter()
+        first = True
+        async for mp3 in tts_cache.stream(text, min_chunk=TTS_STREAM_MIN_CHUNK):
+            if first:
+                TTS_FIRST_CHUNK_LATENCY.observe(time.perf_counter() - t0)
+                first = False
+            self.senders[client].put_audio(audio_frames.CODEC_MP3, raw=mp3)
+        TTS_LATENCY.observe(time.perf_counter() - t0)
+        self.senders[client].put_json({"type":"audio_response_done"})
+
+    def _response_kinds(self, ai_ws) -> set:
+        """Kinds ("user"/"sensor") of responses requested or in progress on ``ai_ws``."""
+        r = self.responses.get(ai_ws)
+        return set(r["pending"].values()) | set(r["active"].values()) if r else set()
+
+    async def _request_response(self, ai_ws, kind: str, modalities: list):
+        """response.create; a pending sensor response is cancelled first – the new prompt supersedes it."""
+        if "sensor" in self._response_kinds(ai_ws):
+            await ai_ws.send(json.dumps({"type":"response.cancel"}))
+            REALTIME_SENSOR.inc(outcome="superseded")
+        r = self.responses.setdefault(ai_ws, {"pending":{}, "active":{}, "seq":0})
+        r["seq"] += 1
+        # event_id חוזר ב-error אם ה-create נדחה – כך יודעים איזה create להוריד
+        event_id = f"create_{kind}_{r['seq']}"
+        r["pending"][event_id] = kind
+        await ai_ws.send(json.dumps({"type":"response.create", "event_id":event_id,
+                                     "response":{"modalities":modalities}}))
+        self.response_requested[ai_ws] = time.perf_counter()
+
+    async def _commit(self, client, ai_ws):
+        if ai_ws:
+            await ai_ws.send(json.dumps({"type":"input_audio_buffer.commit"}))
+            await self._request_response(ai_ws, "user", ["audio","text"])
+            return
+        audio = bytes(self.buffers[client]); self.buffers[client].clear()
+        if audio:
+            t0 = time.perf_counter()
+            try:
+                text = await stt_pool.transcribe(audio)
+            except SttBusy:
+                # backpressure – הלקוח מקבל שגיאה מיידית במקום לחכות בתור ארוך
+                self.senders[client].put_json({"type":"error",
+                                        "error":{"type":"stt_busy",
+                                                 "message":"speech recognition is busy, try again"}})
+                return
+            STT_LATENCY.observe(time.perf_counter() - t0)
+            self.senders[client].put_json({"type":"text_response","text":text})
+        self.senders[client].put_json({"type":"text_response_done"})
 
     # ---------- client → proxy ----------
     async def _from_client(self, client, ai_ws):
-        async for raw in client.iter_text():
-            m = json.loads(raw); typ = m.get("type")
+        vad = None
+        if VAD_ENABLED:
+            vad = VoiceActivityDetector(VAD_SAMPLE_RATE or (24000 if ai_ws else STT_SAMPLE_RATE))
+        gate = SensorGate()
+        pending = 0                 # bytes שנשלחו/נשמרו מאז ה-commit האחרון
+        auto_committed = False
+        audio_file = False          # ה-utterance הנוכחי הוא קובץ WAV/AIFF/FLAC, לא PCM גולמי
+
+        while True:
+            msg = await client.receive()
+            if msg["type"] == "websocket.disconnect":
+                break
+            if msg.get("bytes") is not None:
+                # binary frame = אודיו גולמי; הודעות בקרה נשארות JSON
+                try:
+                    codec, _, pcm = audio_frames.unpack(msg["bytes"])
+                except ValueError as e:
+                    self.senders[client].put_json({"type":"error","error":{"type":"bad_frame","message":str(e)}})
+                    continue
+                if codec != audio_frames.CODEC_PCM16:
+                    # upstream וה-STT מקבלים PCM16 בלבד – MP3/codec לא מוכר לא עובר כאילו היה PCM
+                    self.senders[client].put_json({"type":"error","error":{"type":"bad_frame",
+                                                   "message":f"unsupported input codec {codec}; send PCM16"}})
+                    continue
+                typ, m, b64 = "audio", {}, None
+            else:
+                m = json.loads(msg["text"]); typ = m.get("type")
+                pcm = None
 
             if typ == "audio":
-                b64 = m.get("audio"); self.buffers[client].append(b64)
+                if pcm is None:
+                    b64 = m.get("audio") or ""
+                    # ב-relay ל-OpenAI בלי VAD ה-base64 עובר כמו שהוא, בלי פענוח
+                    if vad or not ai_ws:
+                        try:
+                            pcm = base64.b64decode(b64)
+                        except binascii.Error as e:
+                            # chunk פגום – מדלגים עליו; ה-session ממשיך
+                            self.senders[client].put_json({"type":"error","error":{"type":"bad_audio",
+                                                           "message":f"invalid base64 audio: {e}"}})
+                            continue
+                if not pending and pcm:
+                    audio_file = is_audio_file(pcm)
+                ended = False
+                if vad and not audio_file:
+                    # שקט לא נשלח ל-OpenAI ולא נכנס ל-STT
+                    voiced, ended = vad.feed(pcm)
+                    REALTIME_AUDIO_BYTES.inc(len(pcm) - len(voiced), direction="vad_dropped")
+                    pcm, b64 = voiced, None
                 if ai_ws:
-                    await ai_ws.send(json.dumps({"type":"input_audio_buffer.append","audio":b64}))
+                    if b64 is None:
+                        b64 = base64.b64encode(pcm).decode() if pcm else ""
+                    if b64:
+                        REALTIME_AUDIO_BYTES.inc(len(b64) * 3 // 4, direction="in")
+                        await ai_ws.send(json.dumps({"type":"input_audio_buffer.append","audio":b64}))
+                        pending += len(b64) * 3 // 4
+                else:
+                    buf = self.buffers[client]
+                    buf += pcm
+                    REALTIME_AUDIO_BYTES.inc(len(pcm), direction="in")
+                    pending += len(pcm)
+                    if len(buf) > INPUT_BUFFER_MAX_BYTES:
+                        # PCM – שומרים את הסוף, הדיבור האחרון חשוב יותר ל-STT; קובץ – בלי ה-header הוא לא נקרא
+                        excess = len(buf) - INPUT_BUFFER_MAX_BYTES
+                        if audio_file:
+                            del buf[-excess:]
+                        else:
+                            del buf[:excess]
+                        pending -= excess
+                        REALTIME_AUDIO_BYTES.inc(excess, direction="in_dropped")
+                if ended and VAD_AUTO_COMMIT and pending:
+                    self.senders[client].put_json({"type":"audio_committed","auto":True})
+                    await self._commit(client, ai_ws)
+                    pending, auto_committed, audio_file = 0, True, False
 
             elif typ == "audio_commit":
-                if ai_ws:
-                    await ai_ws.send(json.dumps({"type":"input_audio_buffer.commit"}))
-                    await ai_ws.send(json.dumps({"type":"response.create",
-                                                 "response":{"modalities":["audio","text"]}}))
-                else:
-                    merged = "".join(self.buffers[client]); self.buffers[client].clear()
-                    text   = stt_b64_to_text(merged)
-                    await client.send_json({"type":"text_response","text":text})
-                    await client.send_json({"type":"text_response_done"})
+                if vad:
+                    vad.reset()
+                if auto_committed and not pending:
+                    auto_committed = False          # ה-VAD כבר שלח את ה-commit הזה
+                    continue
+                await self._commit(client, ai_ws)
+                pending, auto_committed, audio_file = 0, False, False
 
             elif typ == "text":
                 txt = m.get("text","")
@@ -109,20 +270,29 @@ class Proxy:
                     await ai_ws.send(json.dumps({"type":"conversation.item.create",
                                                  "item":{"type":"message","role":"user",
                                                          "content":[{"type":"input_text","text":txt}]}}))
-                    await ai_ws.send(json.dumps({"type":"response.create",
-                                                 "response":{"modalities":["audio","text"]}}))
+                    await self._request_response(ai_ws, "user", ["audio","text"])
                 else:
-                    b64 = await tts_mp3_b64(txt)          # ★ Edge-TTS
-                    await client.send_json({"type":"audio_response","audio":b64})
-                    await client.send_json({"type":"audio_response_done"})
+                    await self._stream_tts(client, txt)   # ★ Edge-TTS, chunk אחרי chunk
 
             elif typ == "sensor" and ai_ws:
-                prompt = f"Stress {compute_stress(m):.2f}"
+                # הודעה בודדת או חלון דגימות ב-"readings" – נכנסות ל-EWMA; prompt רק כשה-band משתנה / cooldown
+                gate.update(m)
+                due = gate.check()
+                if due is None:
+                    REALTIME_SENSOR.inc(outcome="absorbed")
+                    continue
+                if "user" in self._response_kinds(ai_ws):
+                    # לא קוטעים תשובה למשתמש; הדגימה הבאה תבדוק שוב
+                    REALTIME_SENSOR.inc(outcome="deferred")
+                    continue
+                score, band = due
+                prompt = f"Stress {score:.2f} ({band})"
                 await ai_ws.send(json.dumps({"type":"conversation.item.create",
                                              "item":{"type":"message","role":"user",
                                                      "content":[{"type":"input_text","text":prompt}]}}))
-                await ai_ws.send(json.dumps({"type":"response.create",
-                                             "response":{"modalities":["audio"]}}))
+                await self._request_response(ai_ws, "sensor", ["audio"])
+                gate.mark(band)
+                REALTIME_SENSOR.inc(outcome="prompted")
 
     # ---------- OpenAI → client ----------
     async def _from_openai(self, ai_ws, client):
@@ -130,30 +300,63 @@ class Proxy:
             log.debug("← OpenAI → Proxy raw: %s", raw)
             e = json.loads(raw); et = e.get("type")
             et = e.get("type")
+            if et in ("response.audio.delta", "response.text.delta"):
+                t_req = self.response_requested.pop(ai_ws, None)
+                if t_req is not None:
+                    OPENAI_LATENCY.observe(time.perf_counter() - t_req, stage="first_delta")
 
             if et == "response.audio.delta":
-                b64 = e.get("delta",{}).get("audio")
+                # ה-API מחזיר את ה-base64 ישירות ב-"delta"; גרסאות ישנות – {"audio": ...}
+                delta = e.get("delta")
+                b64 = delta.get("audio") if isinstance(delta, dict) else delta
                 if b64:
                     log.debug("→ Proxy → Client: audio delta (len=%d)", len(b64))
-                    await client.send_json({"type":"audio_response","audio":b64})
+                    self.senders[client].put_audio(audio_frames.CODEC_PCM16, b64=b64)
             elif et == "response.audio.done":
                 log.debug("→ Proxy → Client: audio done")
-                await client.send_json({"type":"audio_response_done"})
+                self.senders[client].put_json({"type":"audio_response_done","response_id":e.get("response_id")})
             elif et == "response.text.delta":
                 text = e.get("delta", "")
                 log.debug("→ Proxy → Client: text delta: %s", text)
-                await client.send_json({"type":"text_response","text":e.get("delta")})
+                self.senders[client].put_json({"type":"text_response","text":e.get("delta"),
+                                               "response_id":e.get("response_id")})
             elif et == "response.text.done":
                 log.debug("→ Proxy → Client: text done")
-                await client.send_json({"type":"text_response_done"})
+                self.senders[client].put_json({"type":"text_response_done","response_id":e.get("response_id")})
+            elif et == "response.created":
+                r = self.responses.setdefault(ai_ws, {"pending":{}, "active":{}, "seq":0})
+                # התגובות נוצרות לפי סדר ה-create; בלי create שלנו (server VAD) – תשובה למשתמש
+                kind = r["pending"].pop(next(iter(r["pending"]))) if r["pending"] else "user"
+                resp_id = e.get("response", {}).get("id")
+                r["active"][resp_id] = kind
+                # הלקוח יודע איזו תשובה מתחילה ולמה (תשובה לו / דגימת sensor)
+                self.senders[client].put_json({"type":"response_created","response_id":resp_id,"kind":kind})
+            elif et == "response.done":
+                resp = e.get("response", {})
+                r = self.responses.get(ai_ws)
+                if r:
+                    r["active"].pop(resp.get("id"), None)
+                self.senders[client].put_json({"type":"response_done","response_id":resp.get("id"),
+                                               "status":resp.get("status")})
             elif et == "error":
                 err = e.get("error", {})
                 log.error("Error from OpenAI: %s", err)
-                await client.send_json({"type":"error","error":e.get("error",{})})
+                r = self.responses.get(ai_ws)
+                if r and r["pending"]:
+                    # create שנדחה (למשל conversation_already_has_active_response) לא יקבל response.done
+                    if err.get("event_id") in r["pending"]:
+                        del r["pending"][err["event_id"]]
+                    elif err.get("code") == "conversation_already_has_active_response":
+                        r["pending"].pop(next(iter(r["pending"])))
+                self.senders[client].put_json({"type":"error","error":e.get("error",{})})
 
 proxy = Proxy()
 
-proxy = Proxy()
+@app.on_event("startup")
+async def start_proxy(): await proxy.start()
+
+@app.on_event("shutdown")
+async def stop_proxy(): await proxy.stop()
 
 @app.websocket("/v1/realtime")
 async def realtime(ws: WebSocket):
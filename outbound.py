@@ -0,0 +1,227 @@
+"""outbound.py – bounded, coalescing send queue per realtime client
+-----------------------------------------------------------------
+``_from_openai`` used to ``await client.send_json`` for every delta, so one
+slow mobile client stalled the upstream reader, and nothing limited what
+piled up in between. ``ClientSender`` decouples the two:
+
+• producers (upstream reader, local TTS/STT) call ``put_json`` / ``put_audio``,
+  which never block; a sender task drains the queue to the WebSocket;
+• consecutive audio deltas already waiting in the queue are merged into one
+  frame of up to ``OUTBOUND_COALESCE_BYTES``. This adds no latency, since only
+  what is already queued is merged, but a backed-up client gets fewer,
+  larger frames;
+• consecutive ``text_response`` deltas of one response are merged into one
+  message, so a long text stream takes a single queue slot;
+• the queue is capped at ``OUTBOUND_MAX_ITEMS`` items, audio included, and
+  queued audio at ``OUTBOUND_MAX_BYTES``. A control message (``*_done``, text,
+  errors) that hits the cap pushes out the oldest queued audio, and is only
+  dropped when no audio is left to drop. When audio would exceed the cap,
+  ``SLOW_CLIENT_POLICY`` decides:
+    drop        – discard the new delta (the client hears a gap);
+    merge       – merge the whole audio backlog into one frame, then drop the
+                  oldest audio until it fits;
+    disconnect  – drop as above, and close the socket (1013) if the client
+                  stays over the cap for ``SLOW_CLIENT_GRACE`` seconds. The
+                  close comes from the producer side: the sender task is
+                  cancelled and ``ws.close`` waits at most
+                  ``SLOW_CLIENT_CLOSE_TIMEOUT``. ``run`` is most likely
+                  stuck sending to this very client.
+
+``stats()`` reports the queue depth for ``/v1/realtime/queues`` and the gauges.
+"""
+
+import asyncio
+import base64
+import itertools
+import os
+import time
+from collections import deque
+from typing import Deque, Optional
+
+import audio_frames
+from metrics import REALTIME_AUDIO_BYTES, REALTIME_SLOW_CLIENT
+
+OUTBOUND_MAX_BYTES      = int(os.getenv("OUTBOUND_MAX_BYTES", str(1024 * 1024)))
+OUTBOUND_MAX_ITEMS      = int(os.getenv("OUTBOUND_MAX_ITEMS", "512"))
+OUTBOUND_COALESCE_BYTES = int(os.getenv("OUTBOUND_COALESCE_BYTES", "32768"))
+SLOW_CLIENT_POLICY      = os.getenv("SLOW_CLIENT_POLICY", "merge")       # drop | merge | disconnect
+SLOW_CLIENT_GRACE       = float(os.getenv("SLOW_CLIENT_GRACE", "5"))
+SLOW_CLIENT_CLOSE_TIMEOUT = float(os.getenv("SLOW_CLIENT_CLOSE_TIMEOUT", "2"))
+
+
+class _Audio:
+    __slots__ = ("codec", "raw", "b64", "size")
+
+    def __init__(self, codec: int, raw: Optional[bytes], b64: Optional[str]):
+        self.codec, self.raw, self.b64 = codec, raw, b64
+        self.size = len(raw) if raw is not None else len(b64) * 3 // 4
+
+    def data(self) -> bytes:
+        return self.raw if self.raw is not None else base64.b64decode(self.b64)
+
+
+class ClientSender:
+    def __init__(self, ws, binary: bool = False, max_bytes: int = OUTBOUND_MAX_BYTES,
+                 max_items: int = OUTBOUND_MAX_ITEMS, coalesce_bytes: int = OUTBOUND_COALESCE_BYTES,
+                 policy: str = SLOW_CLIENT_POLICY, grace: float = SLOW_CLIENT_GRACE):
+        self.ws = ws
+        self.binary = binary
+        self.max_bytes, self.max_items = max_bytes, max_items
+        self.coalesce_bytes = coalesce_bytes
+        self.policy, self.grace = policy, grace
+        self._items: Deque[object] = deque()
+        self._audio_bytes = 0
+        self._audio_items = 0
+        self._wake = asyncio.Event()
+        self._seq = itertools.count()
+        self._over_since: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None      # ה-task של run()
+        self._closer: Optional[asyncio.Task] = None
+        self.dropped_bytes = 0
+        self.dropped_messages = 0
+        self.closed = False
+
+    # ---------- producers ----------
+    def put_json(self, msg: dict) -> None:
+        if self.closed:
+            return
+        last = self._items[-1] if self._items else None
+        if msg.get("type") == "text_response":
+            if isinstance(last, dict) and last.get("type") == "text_response" \
+                    and last.get("response_id") == msg.get("response_id"):
+                # run() כבר הוציא מהתור את מה שהוא שולח – האחרון בתור עוד לא נשלח
+                last["text"] = (last.get("text") or "") + (msg.get("text") or "")
+                return
+            msg = dict(msg)
+        if self._full(0) and not self._overflow(0, control=True):
+            return
+        self._items.append(msg)
+        self._wake.set()
+
+    def put_audio(self, codec: int, raw: bytes = None, b64: str = None) -> None:
+        if self.closed:
+            return
+        item = _Audio(codec, raw, b64)
+        if self._full(item.size) and not self._overflow(item.size):
+            return
+        self._items.append(item)
+        self._audio_bytes += item.size
+        self._audio_items += 1
+        self._wake.set()
+
+    def _full(self, size: int) -> bool:
+        return self._audio_bytes + size > self.max_bytes or len(self._items) >= self.max_items
+
+    def _overflow(self, size: int, control: bool = False) -> bool:
+        """Apply the slow-client policy; True if the new item (``size`` audio bytes) should still be queued."""
+        now = time.monotonic()
+        if self._over_since is None:
+            self._over_since = now
+        if self.policy == "disconnect" and now - self._over_since > self.grace:
+            REALTIME_SLOW_CLIENT.inc(action="disconnect")
+            self._disconnect()
+            return False
+        if self.policy == "merge" or control:
+            if self.policy == "merge":
+                REALTIME_SLOW_CLIENT.inc(action="merge")
+                self._merge_backlog()
+            # הודעת בקרה נכנסת על חשבון האודיו הישן
+            while self._full(size) and self._drop_oldest_audio():
+                pass
+            if not self._full(size):
+                return True
+        REALTIME_SLOW_CLIENT.inc(action="drop")
+        if control:
+            self.dropped_messages += 1
+        else:
+            self.dropped_bytes += size
+        return False
+
+    def _disconnect(self) -> None:
+        self.closed = True
+        self._items.clear()
+        self._audio_bytes = self._audio_items = 0
+        self._closer = asyncio.get_running_loop().create_task(self._close())
+
+    async def _close(self) -> None:
+        # run() תקוע כנראה ב-send ללקוח האיטי עצמו – סגירה דרך התור לא הייתה מגיעה אליו
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        try:
+            await asyncio.wait_for(self.ws.close(code=1013), SLOW_CLIENT_CLOSE_TIMEOUT)   # try again later
+        except Exception:
+            pass
+
+    async def wait_closed(self) -> None:
+        """Wait for a slow-client disconnect started by the policy, if any."""
+        if self._closer:
+            await asyncio.gather(self._closer, return_exceptions=True)
+
+    def _merge_backlog(self) -> None:
+        merged, out = None, deque()
+        for it in self._items:
+            if isinstance(it, _Audio) and merged is not None and it.codec == merged.codec:
+                merged = _Audio(it.codec, merged.data() + it.data(), None)
+                out[-1] = merged
+            else:
+                merged = it if isinstance(it, _Audio) else None
+                out.append(it)
+        self._items = out
+        audio = [it for it in out if isinstance(it, _Audio)]
+        self._audio_items, self._audio_bytes = len(audio), sum(it.size for it in audio)
+
+    def _drop_oldest_audio(self) -> bool:
+        for i, it in enumerate(self._items):
+            if isinstance(it, _Audio):
+                del self._items[i]
+                self._audio_bytes -= it.size
+                self._audio_items -= 1
+                self.dropped_bytes += it.size
+                return True
+        return False
+
+    # ---------- consumer ----------
+    async def run(self) -> None:
+        """Drain the queue to the WebSocket (runs as the session's send task)."""
+        self._task = asyncio.current_task()
+        while True:
+            while not self._items:
+                self._wake.clear()
+                await self._wake.wait()
+            item = self._items.popleft()
+            if isinstance(item, _Audio):
+                self._audio_bytes -= item.size
+                self._audio_items -= 1
+                item = self._coalesce(item)
+                await self._send_audio(item)
+            else:
+                await self.ws.send_json(item)
+            if self._audio_bytes <= self.max_bytes // 2:
+                self._over_since = None
+
+    def _coalesce(self, first: _Audio) -> _Audio:
+        if not self._items or not isinstance(self._items[0], _Audio):
+            return first
+        parts, size = [first.data()], first.size
+        while self._items and isinstance(self._items[0], _Audio) \
+                and self._items[0].codec == first.codec and size + self._items[0].size <= self.coalesce_bytes:
+            nxt = self._items.popleft()
+            self._audio_bytes -= nxt.size
+            self._audio_items -= 1
+            parts.append(nxt.data())
+            size += nxt.size
+        return first if len(parts) == 1 else _Audio(first.codec, b"".join(parts), None)
+
+    async def _send_audio(self, item: _Audio) -> None:
+        REALTIME_AUDIO_BYTES.inc(item.size, direction="out")
+        if self.binary:
+            await self.ws.send_bytes(audio_frames.pack(item.codec, next(self._seq), item.data()))
+        else:
+            b64 = item.b64 if item.b64 is not None else base64.b64encode(item.raw).decode()
+            await self.ws.send_json({"type":"audio_response","audio":b64})
+
+    def stats(self) -> dict:
+        return {"items": len(self._items), "audio_bytes": self._audio_bytes,
+                "dropped_bytes": self.dropped_bytes, "dropped_messages": self.dropped_messages,
+                "binary": self.binary}
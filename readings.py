@@ -0,0 +1,180 @@
+"""readings.py – read API for **SensorReading** time series
+-----------------------------------------------------------
+Dashboards pull hours of readings per user, so this router serves time-range
+queries straight off the ``(user_id, timestamp)`` index with keyset
+pagination: every page is an index seek, however deep into the range it is.
+Charts that only need aggregates read ``/readings/rollup`` (see ``rollup.py``);
+bulk pulls for model training go through ``/readings/export`` (see ``export.py``).
+
+Usage (in ``server.py``):
+>>> from readings import router as readings_router
+>>> app.include_router(readings_router)
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from export import EXPORT_FORMATS, EXTENSIONS, MEDIA_TYPES, export_readings, resolve_format
+from model import SensorReading, get_async_db  # type: ignore
+from rollup import ROLLUP_METRICS, rollup_table
+
+# עמודות שמותר לבקש ב-fields (id ו-timestamp תמיד מוחזרים – הם הסמן)
+READING_FIELDS = {c.name: c for c in SensorReading.__table__.columns}
+ALWAYS_FIELDS = ("id", "timestamp")
+
+DEFAULT_PAGE = 500
+MAX_PAGE = 5000
+
+
+# ───────────────────────────── Pydantic schemas ────────────────────────────────
+class ReadingPage(BaseModel):
+    """One page of readings plus the cursor for the next one (``None`` at the end)."""
+
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
+class MetricSummary(BaseModel):
+    count: int
+    min: Optional[float] = None
+    max: Optional[float] = None
+    avg: Optional[float] = None
+
+
+class RollupPoint(BaseModel):
+    """Aggregates of one time bucket; metrics without samples have ``count == 0``."""
+
+    bucket_start: datetime
+    metrics: Dict[str, MetricSummary]
+
+
+# ───────────────────────────────── Cursor helpers ──────────────────────────────
+def encode_cursor(timestamp: datetime, reading_id: int) -> str:
+    raw = json.dumps([timestamp.isoformat(), reading_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, reading_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(ts), int(reading_id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """``"heart_rate,hrv_ms"`` → validated column list (``None`` = all columns)."""
+    if not fields:
+        return list(READING_FIELDS)
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [n for n in names if n not in READING_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return list(ALWAYS_FIELDS) + [n for n in names if n not in ALWAYS_FIELDS]
+
+
+# ──────────────────────────────── API router ───────────────────────────────────
+router = APIRouter(prefix="/readings", tags=["readings"])
+
+
+@router.get("", response_model=ReadingPage, status_code=status.HTTP_200_OK)
+async def query_readings(
+    user_id: Optional[str] = None,
+    device_id: Optional[str] = None,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE, ge=1, le=MAX_PAGE),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Readings in ``[from, to)`` ordered by ``(timestamp, id)``.
+
+    Pass the returned ``next_cursor`` back as ``cursor`` to get the next page.
+    Only the columns named in ``fields`` (plus ``id`` and ``timestamp``) are read.
+    """
+    if user_id is None and device_id is None:
+        raise HTTPException(status_code=400, detail="user_id or device_id is required")
+
+    names = parse_fields(fields)
+    stmt = select(*(READING_FIELDS[n] for n in names))
+    if user_id is not None:
+        stmt = stmt.where(SensorReading.user_id == user_id)
+    if device_id is not None:
+        stmt = stmt.where(SensorReading.device_id == device_id)
+    if from_ is not None:
+        stmt = stmt.where(SensorReading.timestamp >= from_)
+    if to is not None:
+        stmt = stmt.where(SensorReading.timestamp < to)
+    if cursor:
+        stmt = stmt.where(tuple_(SensorReading.timestamp, SensorReading.id) > decode_cursor(cursor))
+    stmt = stmt.order_by(SensorReading.timestamp, SensorReading.id).limit(limit + 1)
+
+    rows = (await db.execute(stmt)).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    return ReadingPage(items=[dict(r) for r in rows], next_cursor=next_cursor)
+
+
+@router.get("/rollup", response_model=List[RollupPoint], status_code=status.HTTP_200_OK)
+async def query_rollup(
+    user_id: str,
+    bucket: str = Query("1m", pattern="^(1m|1h)$"),
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Pre-aggregated min/max/avg/count per ``bucket`` in ``[from, to)`` for one user."""
+    t = rollup_table.c
+    stmt = select(rollup_table).where(t.bucket == bucket, t.user_id == user_id)
+    if from_ is not None:
+        stmt = stmt.where(t.bucket_start >= from_)
+    if to is not None:
+        stmt = stmt.where(t.bucket_start < to)
+    stmt = stmt.order_by(t.bucket_start)
+
+    points = []
+    for row in (await db.execute(stmt)).mappings():
+        metrics = {}
+        for m in ROLLUP_METRICS:
+            n = row[f"{m}_count"] or 0
+            metrics[m] = MetricSummary(
+                count=n,
+                min=row[f"{m}_min"],
+                max=row[f"{m}_max"],
+                avg=row[f"{m}_sum"] / n if n else None,
+            )
+        points.append(RollupPoint(bucket_start=row["bucket_start"], metrics=metrics))
+    return points
+
+
+@router.get("/export", status_code=status.HTTP_200_OK)
+def export_readings_file(
+    user_id: Optional[str] = None,
+    device_id: Optional[str] = None,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    format: str = Query("parquet", pattern=f"^({'|'.join(EXPORT_FORMATS)})$"),
+):
+    """Stream the matching readings as Parquet / Arrow IPC / CSV without buffering the result."""
+    if user_id is None and device_id is None:
+        raise HTTPException(status_code=400, detail="user_id or device_id is required")
+
+    fmt = resolve_format(format)
+    name = f"readings_{user_id or device_id}.{EXTENSIONS[fmt]}"
+    return StreamingResponse(
+        export_readings(fmt, user_id=user_id, device_id=device_id, from_=from_, to=to),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
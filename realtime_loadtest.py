@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""Concurrent load tester for the /v1/realtime proxy.
+
+Built on the same message format as realtime_testclient.py, but opens many
+sessions at once and measures instead of saving output:
+
+- N concurrent sessions, started evenly over a ramp-up period.
+- Every session plays a number of turns drawn from a weighted mix of
+  audio (PCM16 chunks + audio_commit), text (prompt → audio) and sensor
+  messages.
+- Per turn: time-to-first-audio, time-to-first-text and full response latency
+  (until the done event of every modality the turn expects). Per session:
+  connect time and whether it was dropped.
+- In OpenAI mode responses are told apart by ``response_id``: a turn adopts
+  the first ``response_created`` of its kind, and events of earlier responses
+  (a superseded sensor reply, the tail of a timed-out turn) are discarded.
+  After a turn that timed out or failed, the socket is drained until it has
+  been quiet for ``--drain-ms`` before the next turn starts.
+- Prints a percentile summary and can write it as JSON.
+
+Only base64 lengths are logged, never payloads. No network beyond the target
+URL is needed, so it runs offline against the server in local mode or against
+a stub OpenAI upstream.
+
+Usage examples
+--------------
+python realtime_loadtest.py --sessions 50 --ramp-up 10 --turns 5 --mix audio=2,text=1,sensor=3
+python realtime_loadtest.py --input angry_sample.wav --sessions 20 --json results.json
+
+Dependencies
+------------
+pip install websockets
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import websockets   # pip install websockets
+
+import audio_frames
+from realtime_testclient import DEFAULT_WS_URL, read_wav_as_pcm16
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s | %(message)s")
+logger = logging.getLogger("rt-load")
+
+# done events each turn waits for: mode → message kind → events
+EXPECTED_DONE = {
+    "openai": {"audio": {"text_response_done", "audio_response_done"},
+               "text": {"text_response_done", "audio_response_done"},
+               "sensor": {"audio_response_done"}},
+    # מצב מקומי: audio → STT (טקסט בלבד), text → Edge-TTS (אודיו בלבד), sensor – בלי תשובה
+    "local": {"audio": {"text_response_done"},
+              "text": {"audio_response_done"},
+              "sensor": set()},
+}
+
+
+# ------------------------- Helpers ---------------------------
+def synthetic_pcm16(seconds: float, sample_rate: int) -> bytes:
+    """A 220 Hz tone with short silences – stands in for speech when no WAV is given."""
+    n = int(seconds * sample_rate)
+    out = bytearray()
+    for i in range(n):
+        t = i / sample_rate
+        amp = 8000 if (t % 1.0) < 0.8 else 0
+        out += int(amp * math.sin(2 * math.pi * 220 * t)).to_bytes(2, "little", signed=True)
+    return bytes(out)
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """``"audio=2,text=1,sensor=3"`` → weights."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, w = part.partition("=")
+        if name not in ("audio", "text", "sensor"):
+            raise ValueError(f"unknown message kind {name!r}")
+        mix[name] = float(w or 1)
+    return mix
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def sensor_message(rng: random.Random) -> dict:
+    return {"type": "sensor", "heart_rate": rng.randint(60, 140),
+            "rage_probability": round(rng.uniform(0, 90), 1)}
+
+
+@dataclass
+class Stats:
+    connect: List[float] = field(default_factory=list)
+    ttfa: List[float] = field(default_factory=list)
+    ttft: List[float] = field(default_factory=list)
+    full: List[float] = field(default_factory=list)
+    turns: Dict[str, int] = field(default_factory=dict)
+    timeouts: int = 0
+    errors: int = 0
+    sessions_ok: int = 0
+    sessions_dropped: int = 0
+
+
+# ---------- Session ----------------------------------------------------------
+class ResponseStream:
+    """Events of one session's socket, attributed to responses by ``response_id``.
+
+    Audio deltas carry no id; they belong to the response that is streaming –
+    the upstream runs one response at a time per conversation.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.streaming: Optional[str] = None     # response_created שעוד לא קיבל response_done
+        self.stale: Set[str] = set()             # תשובות של turns קודמים / sensor
+
+    async def next(self, timeout: float) -> dict:
+        raw = await asyncio.wait_for(self.ws.recv(), timeout)
+        # binary frame = audio delta (audio_frames.py)
+        evt = json.loads(raw) if isinstance(raw, str) else {"type": "audio_response"}
+        typ = evt.get("type")
+        if typ == "response_created":
+            self.streaming = evt.get("response_id")
+        elif typ == "audio_response":
+            evt.setdefault("response_id", self.streaming)
+        elif typ == "response_done" and evt.get("response_id") == self.streaming:
+            self.streaming = None
+        return evt
+
+    async def drain(self, quiet: float) -> None:
+        """Discard events until nothing has arrived for ``quiet`` seconds."""
+        while True:
+            try:
+                evt = await self.next(quiet)
+            except asyncio.TimeoutError:
+                return
+            if evt.get("response_id"):
+                self.stale.add(evt["response_id"])
+
+
+async def await_response(stream: ResponseStream, t0: float, stats: Stats, timeout: float,
+                         kind: str, expect: Set[str]) -> bool:
+    """Read until every done event in ``expect`` arrived for this turn's response.
+
+    Records first-audio/first-text times and the full latency; returns False
+    when the turn timed out or failed, so the caller can drain the socket.
+    """
+    want = "user" if kind in ("audio", "text") else "sensor"
+    response_id: Optional[str] = None
+    pending = set(expect)
+    got_audio = got_text = False
+    deadline = t0 + timeout
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            stats.timeouts += 1
+            return False
+        try:
+            evt = await stream.next(remaining)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            return False
+        now = time.perf_counter()
+        typ, rid = evt.get("type"), evt.get("response_id")
+        if typ == "response_created":
+            if response_id is None and evt.get("kind") == want and rid not in stream.stale:
+                response_id = rid
+            else:
+                stream.stale.add(rid)
+            continue
+        if typ == "error":
+            stats.errors += 1
+            logger.debug("error event: %s", evt.get("error"))
+            if response_id is None:
+                return False             # ה-create נדחה – לא תגיע תשובה
+            continue
+        if rid is not None and rid != response_id:
+            continue                     # תשובה אחרת – לא נמדדת ב-turn הזה
+        if typ == "response_done":
+            if pending:
+                # בוטלה / נכשלה לפני שכל ה-modalities הגיעו
+                stats.errors += 1
+                logger.debug("response %s ended %s", rid, evt.get("status"))
+                return False
+            continue
+        if typ == "audio_response" and not got_audio:
+            got_audio = True
+            stats.ttfa.append(now - t0)
+        elif typ == "text_response" and not got_text:
+            got_text = True
+            stats.ttft.append(now - t0)
+        pending.discard(typ)
+        if not pending:
+            stats.full.append(now - t0)
+            if response_id is not None:
+                stream.stale.add(response_id)
+            return True
+
+
+async def run_session(idx: int, args, audio: bytes, mix: Dict[str, float], stats: Stats) -> None:
+    rng = random.Random(f"{args.seed}-{idx}")
+    kinds, weights = list(mix), list(mix.values())
+    chunk_bytes = max(2, int(args.sample_rate * args.chunk_ms / 1000) * 2)
+    t_connect = time.perf_counter()
+    try:
+        subprotocols = [audio_frames.SUBPROTOCOL] if args.binary else None
+        async with websockets.connect(args.url, max_size=None, subprotocols=subprotocols) as ws:
+            stats.connect.append(time.perf_counter() - t_connect)
+            stream = ResponseStream(ws)
+            for _ in range(args.turns):
+                kind = rng.choices(kinds, weights)[0]
+                stats.turns[kind] = stats.turns.get(kind, 0) + 1
+                expect = EXPECTED_DONE[args.mode][kind]
+                await_turn = bool(expect) and (kind != "sensor" or args.await_sensor)
+                if kind == "audio":
+                    for seq, i in enumerate(range(0, len(audio), chunk_bytes)):
+                        chunk = audio[i:i + chunk_bytes]
+                        if args.binary:
+                            await ws.send(audio_frames.pack(audio_frames.CODEC_PCM16, seq, chunk))
+                        else:
+                            await ws.send(json.dumps({"type": "audio", "audio": base64.b64encode(chunk).decode()}))
+                        if args.realtime_pacing:
+                            await asyncio.sleep(args.chunk_ms / 1000)
+                    t0 = time.perf_counter()
+                    await ws.send(json.dumps({"type": "audio_commit"}))
+                elif kind == "text":
+                    t0 = time.perf_counter()
+                    await ws.send(json.dumps({"type": "text", "text": args.text}))
+                else:
+                    t0 = time.perf_counter()
+                    await ws.send(json.dumps(sensor_message(rng)))
+                if await_turn and not await await_response(stream, t0, stats, args.timeout, kind, expect):
+                    await stream.drain(args.drain_ms / 1000)
+                if args.think_ms:
+                    await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+        stats.sessions_ok += 1
+    except (OSError, websockets.exceptions.WebSocketException) as e:
+        stats.sessions_dropped += 1
+        logger.debug("session %d dropped: %s", idx, e)
+
+
+# ---------- Summary ----------------------------------------------------------
+def summary(stats: Stats, elapsed: float) -> dict:
+    def dist(values: List[float]) -> dict:
+        v = sorted(values)
+        ms = lambda x: None if x is None else round(x * 1000, 1)
+        return {"n": len(v), "p50_ms": ms(percentile(v, 50)), "p90_ms": ms(percentile(v, 90)),
+                "p95_ms": ms(percentile(v, 95)), "p99_ms": ms(percentile(v, 99)),
+                "max_ms": ms(v[-1] if v else None)}
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "sessions_ok": stats.sessions_ok,
+        "sessions_dropped": stats.sessions_dropped,
+        "turns": stats.turns,
+        "timeouts": stats.timeouts,
+        "errors": stats.errors,
+        "connect": dist(stats.connect),
+        "time_to_first_audio": dist(stats.ttfa),
+        "time_to_first_text": dist(stats.ttft),
+        "full_response": dist(stats.full),
+    }
+
+
+def print_summary(s: dict) -> None:
+    print(f"\nsessions ok={s['sessions_ok']} dropped={s['sessions_dropped']}  "
+          f"turns={s['turns']}  timeouts={s['timeouts']}  errors={s['errors']}  elapsed={s['elapsed_s']}s")
+    print(f"{'metric':22s} {'n':>6s} {'p50':>9s} {'p90':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s}")
+    for name in ("connect", "time_to_first_audio", "time_to_first_text", "full_response"):
+        d = s[name]
+        cells = [f"{d[k]:9.1f}" if d[k] is not None else f"{'-':>9s}"
+                 for k in ("p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{name:22s} {d['n']:6d} " + " ".join(cells))
+
+
+async def main():
+    ap = argparse.ArgumentParser(description="Concurrent load tester for the realtime proxy")
+    ap.add_argument("--url", default=DEFAULT_WS_URL, help=f"WebSocket endpoint (default {DEFAULT_WS_URL})")
+    ap.add_argument("--mode", choices=sorted(EXPECTED_DONE), default="openai",
+                    help="server mode – decides which done events each turn waits for")
+    ap.add_argument("--sessions", type=int, default=10, help="concurrent sessions")
+    ap.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which sessions are started")
+    ap.add_argument("--turns", type=int, default=3, help="messages per session")
+    ap.add_argument("--mix", default="audio=1,text=1,sensor=1", help="weighted message mix")
+    ap.add_argument("--input", help="mono PCM16 WAV to replay (default: synthetic tone)")
+    ap.add_argument("--synthetic-seconds", type=float, default=2.0)
+    ap.add_argument("--sample-rate", type=int, default=16000)
+    ap.add_argument("--chunk-ms", type=int, default=100, help="audio chunk size in ms")
+    ap.add_argument("--binary", action="store_true", help="binary audio frames instead of base64 JSON")
+    ap.add_argument("--realtime-pacing", action="store_true", help="send audio chunks at real-time speed")
+    ap.add_argument("--text", default="I'm feeling overwhelmed, can you help?")
+    ap.add_argument("--await-sensor", action="store_true",
+                    help="wait for a response after sensor messages (OpenAI mode); "
+                         "readings the server absorbs count as timeouts")
+    ap.add_argument("--think-ms", type=int, default=0, help="mean pause between turns")
+    ap.add_argument("--timeout", type=float, default=30.0, help="per-turn response timeout (s)")
+    ap.add_argument("--drain-ms", type=int, default=500,
+                    help="after a timed-out or failed turn, discard events until the socket is quiet this long")
+    ap.add_argument("--seed", type=int, default=2025)
+    ap.add_argument("--json", help="write the summary as JSON to this path")
+    args = ap.parse_args()
+
+    audio = read_wav_as_pcm16(Path(args.input)) if args.input \
+        else synthetic_pcm16(args.synthetic_seconds, args.sample_rate)
+    mix = parse_mix(args.mix)
+    stats = Stats()
+
+    logger.info("Starting %d sessions over %.1fs against %s", args.sessions, args.ramp_up, args.url)
+    t_start = time.perf_counter()
+    tasks = []
+    for i in range(args.sessions):
+        tasks.append(asyncio.create_task(run_session(i, args, audio, mix, stats)))
+        if args.sessions > 1:
+            await asyncio.sleep(args.ramp_up / args.sessions)
+    await asyncio.gather(*tasks)
+
+    s = summary(stats, time.perf_counter() - t_start)
+    print_summary(s)
+    if args.json:
+        Path(args.json).write_text(json.dumps(s, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Interrupted by user")
@@ -16,6 +16,7 @@ python realtime_test_client.py --mode text --input \"I'm feeling overwhelmed, ca
 
 # Optional flags
 --url ws://localhost:8080/v1/realtime   # Change if server is remote
+--binary                                # Raw audio in binary frames (audio_frames.py) instead of base64 JSON
 --sample-rate 16000                     # Audio sample‑rate (only when mode=text)
 
 Dependencies
@@ -30,11 +31,12 @@ import json
 import sys
 import wave
 from pathlib import Path
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 import logging
 
 import websockets   # pip install websockets
 
+import audio_frames
+
 # Configure logging to console
 logging.basicConfig(
     level=logging.INFO,
@@ -49,8 +51,9 @@ def read_wav_as_pcm16(path: Path) -> bytes:
     with wave.open(str(path), "rb") as w:
         if w.getnchannels() != 1 or w.getsampwidth() != 2:
             raise ValueError("WAV must be mono 16‑bit PCM")
+        data = w.readframes(w.getnframes())
         logger.info("Loaded WAV file '%s' (%d bytes)", path, len(data))
-        return w.readframes(w.getnframes())
+        return data
 
 def write_pcm16_as_wav(pcm: bytes, path: Path, sample_rate: int = 16000):
     """Write raw PCM16 data to a WAV container (mono)."""
@@ -61,13 +64,20 @@ def write_pcm16_as_wav(pcm: bytes, path: Path, sample_rate: int = 16000):
         w.writeframes(pcm)
         logger.info("Wrote WAV file '%s' (%.2f seconds)", path, len(pcm) / 2 / sample_rate)
 
+def summarize(evt: dict) -> dict:
+    """Message for logging: base64 payloads replaced by their length."""
+    return {k: (f"<{len(v)} b64 chars>" if k == "audio" and isinstance(v, str) else v)
+            for k, v in evt.items()}
+
 # ---------- Main client ------------------------------------------------------
-async def audio_to_text(ws, audio_bytes: bytes, txt_path: Path):
-    payload = {"type": "audio", "audio": base64.b64encode(audio_bytes).decode()}
-    logger.info("Sending request to server: %s", payload)
+async def audio_to_text(ws, audio_bytes: bytes, txt_path: Path, binary: bool = False):
+    logger.info("Sending %d bytes of audio (%s)", len(audio_bytes), "binary" if binary else "json")
     # 1) send audio buffer
-    await ws.send(json.dumps({"type": "audio",
-                              "audio": base64.b64encode(audio_bytes).decode()}))
+    if binary:
+        await ws.send(audio_frames.pack(audio_frames.CODEC_PCM16, 0, audio_bytes))
+    else:
+        await ws.send(json.dumps({"type": "audio",
+                                  "audio": base64.b64encode(audio_bytes).decode()}))
     # 2) commit & request response
     commit = {"type": "audio_commit"}
     logger.info("Sending commit request: %s", commit)
@@ -77,9 +87,8 @@ async def audio_to_text(ws, audio_bytes: bytes, txt_path: Path):
     # 3) collect streamed text
     transcript = []
     async for msg in ws:
-        logger.info("Received raw message: %s", msg)
         evt = json.loads(msg)
-        typ = evt.get("type")
+        logger.debug("Received %s", summarize(evt))
         if evt.get("type") == "text_response":
             text_chunk = evt.get("text", "")
             logger.info("Text chunk received: '%s'", text_chunk)
@@ -100,9 +109,14 @@ async def text_to_audio(ws, text_prompt: str, wav_path: Path, sample_rate: int):
     # 2) collect audio deltas
     pcm_chunks = []
     async for msg in ws:
-        logger.info("Received raw message: %s", msg)
+        if isinstance(msg, bytes):
+            # מצב binary – header קטן ואחריו האודיו עצמו
+            _, seq, audio_data = audio_frames.unpack(msg)
+            logger.info("Audio frame #%d received (%d bytes)", seq, len(audio_data))
+            pcm_chunks.append(audio_data)
+            continue
         evt = json.loads(msg)
-        typ = evt.get("type")
+        logger.debug("Received %s", summarize(evt))
         if evt.get("type") == "audio_response":
             audio_data = base64.b64decode(evt.get("audio"))
             logger.info("Audio chunk received (%d bytes)", len(audio_data))
@@ -127,12 +141,15 @@ async def main():
                     help=f"WebSocket endpoint (default {DEFAULT_WS_URL})")
     ap.add_argument("--sample-rate", type=int, default=16000,
                     help="Sample‑rate for generated WAV (mode=text)")
+    ap.add_argument("--binary", action="store_true",
+                    help="Negotiate binary audio frames instead of base64 JSON")
     args = ap.parse_args()
 
     logger.info("Connecting to WebSocket URL: %s", args.url)
 
 
-    async with websockets.connect(args.url) as ws:
+    subprotocols = [audio_frames.SUBPROTOCOL] if args.binary else None
+    async with websockets.connect(args.url, subprotocols=subprotocols) as ws:
         logger.info("WebSocket connection established")
         if args.mode == "audio":
             wav_path = Path(args.input)
@@ -140,7 +157,7 @@ async def main():
                 logger.error("Audio file %s not found", wav_path)
                 sys.exit(1)
             audio_bytes = read_wav_as_pcm16(wav_path)
-            await audio_to_text(ws, audio_bytes, Path(args.output))
+            await audio_to_text(ws, audio_bytes, Path(args.output), args.binary)
         else:
             await text_to_audio(ws, args.input, Path(args.output), args.sample_rate)
 
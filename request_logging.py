@@ -0,0 +1,155 @@
+"""request_logging.py – sampled, streaming-safe request logging
+--------------------------------------------------------------
+Replaces the old ``log_requests`` middleware, which awaited the whole request
+body, rebuilt ``response.body_iterator`` from every chunk and logged both
+bodies synchronously on the event loop.
+
+``RequestLoggingMiddleware`` is a plain ASGI middleware that only observes the
+messages passing through:
+• bodies are captured up to ``LOG_BODY_MAX`` bytes, and only for textual content
+  types – binary uploads/downloads and streamed responses are never buffered;
+• each request becomes one JSON log line (method, route, status, duration,
+  sizes, truncated bodies);
+• successful requests are sampled per route prefix (``LOG_SAMPLE_RATES``,
+  e.g. ``"/health=0,/readings=0.05"``); 4xx/5xx are always logged.
+
+``setup_logging`` routes all records through a ``QueueHandler`` so formatting
+and stream I/O happen on a background ``QueueListener`` thread.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from typing import Dict, Optional, Tuple
+
+LOG_LEVEL          = os.getenv("LOG_LEVEL", "INFO")
+LOG_BODY_MAX       = int(os.getenv("LOG_BODY_MAX", "2048"))
+LOG_SAMPLE_DEFAULT = float(os.getenv("LOG_SAMPLE_DEFAULT", "1.0"))
+LOG_SAMPLE_RATES   = os.getenv("LOG_SAMPLE_RATES", "/health=0,/metrics=0")
+
+TEXT_TYPES = ("application/json", "text/", "application/x-www-form-urlencoded", "application/xml")
+
+log = logging.getLogger("http")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = "%(levelname)s | %(message)s") -> None:
+    """Install a queue-based root handler; the real stream handler runs on a background thread."""
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(fmt))
+    q: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    root = logging.getLogger()
+    # מודולים אחרים (openAI.py) כבר קראו ל-basicConfig – מחליפים את ה-handlers שלהם
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(logging.handlers.QueueHandler(q))
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def parse_sample_rates(spec: str) -> Tuple[Tuple[str, float], ...]:
+    """``"/health=0,/readings=0.1"`` → prefixes sorted longest first."""
+    rates = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        prefix, _, rate = part.partition("=")
+        rates.append((prefix, float(rate or 1)))
+    return tuple(sorted(rates, key=lambda r: -len(r[0])))
+
+
+def _is_text(content_type: str) -> bool:
+    return content_type.startswith(TEXT_TYPES)
+
+
+def _header(headers, name: bytes) -> str:
+    for k, v in headers:
+        if k.lower() == name:
+            return v.decode("latin-1")
+    return ""
+
+
+class RequestLoggingMiddleware:
+    def __init__(self, app, max_body: int = LOG_BODY_MAX, default_rate: float = LOG_SAMPLE_DEFAULT,
+                 sample_rates: str = LOG_SAMPLE_RATES):
+        self.app = app
+        self.max_body = max_body
+        self.default_rate = default_rate
+        self.sample_rates = parse_sample_rates(sample_rates)
+
+    def _rate(self, path: str, status: int) -> float:
+        if status >= 400:
+            return 1.0
+        for prefix, rate in self.sample_rates:
+            if path.startswith(prefix):
+                return rate
+        return self.default_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        capture_req = self.max_body > 0 and _is_text(_header(scope.get("headers", ()), b"content-type"))
+        req_body, resp_body = bytearray(), bytearray()
+        info: Dict[str, object] = {"status": 500, "req_bytes": 0, "resp_bytes": 0, "streamed": False}
+        capture_resp = False
+
+        async def receive_wrapper():
+            msg = await receive()
+            if msg["type"] == "http.request":
+                chunk = msg.get("body", b"")
+                info["req_bytes"] += len(chunk)
+                if capture_req and len(req_body) < self.max_body:
+                    req_body.extend(chunk[: self.max_body - len(req_body)])
+            return msg
+
+        async def send_wrapper(msg):
+            nonlocal capture_resp
+            if msg["type"] == "http.response.start":
+                info["status"] = msg["status"]
+                headers = msg.get("headers", ())
+                capture_resp = self.max_body > 0 and _is_text(_header(headers, b"content-type"))
+            elif msg["type"] == "http.response.body":
+                chunk = msg.get("body", b"")
+                info["resp_bytes"] += len(chunk)
+                if msg.get("more_body"):
+                    # תגובה ב-streaming – לא שומרים גוף
+                    info["streamed"] = True
+                    capture_resp = False
+                    resp_body.clear()
+                elif capture_resp and len(resp_body) < self.max_body:
+                    resp_body.extend(chunk[: self.max_body - len(resp_body)])
+            await send(msg)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            status = int(info["status"])
+            route = getattr(scope.get("route"), "path", None) or scope["path"]
+            if random.random() < self._rate(scope["path"], status):
+                entry = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status,
+                    "ms": round((time.perf_counter() - start) * 1000, 1),
+                    "req_bytes": info["req_bytes"],
+                    "resp_bytes": info["resp_bytes"],
+                    "streamed": info["streamed"],
+                }
+                if req_body:
+                    entry["req_body"] = req_body.decode(errors="replace")
+                if resp_body and not info["streamed"]:
+                    entry["resp_body"] = resp_body.decode(errors="replace")
+                level = logging.ERROR if status >= 500 else logging.WARNING if status >= 400 else logging.INFO
+                log.log(level, json.dumps(entry, ensure_ascii=False))
@@ -0,0 +1,162 @@
+"""rollup.py – per-user 1-minute / 1-hour aggregates of **SensorReading**
+-------------------------------------------------------------------------
+Charts and alerting read count/sum/min/max of the main indicators per time
+bucket instead of scanning raw ``sensor_readings``. The table is kept up to
+date incrementally by the ingestion path (``apply_rollups`` runs inside the
+same transaction as the INSERT) and can be rebuilt from scratch with
+``backfill_rollups``.
+
+CLI:
+    python rollup.py --backfill
+"""
+
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import Column, DateTime, Float, Integer, String, Table, delete, func, insert, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from model import Base, SensorReading, SessionLocal, engine  # type: ignore
+
+# מדדים שנצברים בכל דלי זמן
+ROLLUP_METRICS = ("heart_rate", "hrv_ms", "eda_microsiemens", "skin_temp_c", "rage_probability")
+AGGREGATES = ("count", "sum", "min", "max")
+
+# דלי → פורמט strftime של SQLite (תואם לפורמט שבו SQLAlchemy שומר DateTime)
+BUCKETS = {
+    "1m": "%Y-%m-%d %H:%M:00.000000",
+    "1h": "%Y-%m-%d %H:00:00.000000",
+}
+
+# ───────────────────────────── SQLAlchemy model ────────────────────────────────
+rollup_table = Table(
+    "sensor_rollups",
+    Base.metadata,
+    Column("bucket", String, primary_key=True),          # "1m" / "1h"
+    Column("user_id", String, primary_key=True),
+    Column("bucket_start", DateTime, primary_key=True),
+    *[
+        Column(f"{m}_{agg}", Integer if agg == "count" else Float,
+               nullable=agg in ("min", "max"), default=0 if agg in ("count", "sum") else None)
+        for m in ROLLUP_METRICS for agg in AGGREGATES
+    ],
+)
+
+
+class SensorRollup(Base):
+    """One (bucket, user, bucket_start) row of aggregated indicators."""
+
+    __table__ = rollup_table
+
+
+Base.metadata.create_all(bind=engine)
+
+
+# ───────────────────────────── incremental update ──────────────────────────────
+def bucket_start(ts: datetime, bucket: str) -> datetime:
+    if bucket == "1m":
+        return ts.replace(second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _aggregate(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fold raw rows into one partial aggregate per (bucket, user, start)."""
+    acc: Dict[tuple, Dict[str, Any]] = defaultdict(dict)
+    for row in rows:
+        ts = row.get("timestamp")
+        if ts is None or row.get("user_id") is None:
+            continue
+        for bucket in BUCKETS:
+            key = (bucket, row["user_id"], bucket_start(ts, bucket))
+            part = acc[key]
+            if not part:
+                part.update(bucket=key[0], user_id=key[1], bucket_start=key[2])
+                for m in ROLLUP_METRICS:
+                    part.update({f"{m}_count": 0, f"{m}_sum": 0.0, f"{m}_min": None, f"{m}_max": None})
+            for m in ROLLUP_METRICS:
+                v = row.get(m)
+                if v is None:
+                    continue
+                part[f"{m}_count"] += 1
+                part[f"{m}_sum"] += v
+                lo, hi = part[f"{m}_min"], part[f"{m}_max"]
+                part[f"{m}_min"] = v if lo is None or v < lo else lo
+                part[f"{m}_max"] = v if hi is None or v > hi else hi
+    return list(acc.values())
+
+
+def _upsert_statement():
+    stmt = sqlite_insert(rollup_table)
+    t, ex = rollup_table.c, stmt.excluded
+    set_ = {}
+    for m in ROLLUP_METRICS:
+        set_[f"{m}_count"] = t[f"{m}_count"] + ex[f"{m}_count"]
+        set_[f"{m}_sum"] = t[f"{m}_sum"] + ex[f"{m}_sum"]
+        # MIN/MAX סקלריים של SQLite מחזירים NULL אם אחד הצדדים NULL
+        set_[f"{m}_min"] = func.min(func.coalesce(t[f"{m}_min"], ex[f"{m}_min"]),
+                                    func.coalesce(ex[f"{m}_min"], t[f"{m}_min"]))
+        set_[f"{m}_max"] = func.max(func.coalesce(t[f"{m}_max"], ex[f"{m}_max"]),
+                                    func.coalesce(ex[f"{m}_max"], t[f"{m}_max"]))
+    return stmt.on_conflict_do_update(index_elements=["bucket", "user_id", "bucket_start"], set_=set_)
+
+
+_UPSERT = _upsert_statement()
+
+
+def apply_rollups(db: Session, rows: Iterable[Dict[str, Any]]) -> None:
+    """Merge freshly ingested ``rows`` into the rollup table (caller commits)."""
+    parts = _aggregate(rows)
+    if parts:
+        db.execute(_UPSERT, parts)
+
+
+# ───────────────────────────────── backfill ────────────────────────────────────
+def backfill_rollups(db: Session, user_id: Optional[str] = None) -> int:
+    """Recompute every bucket from ``sensor_readings`` (optionally for one user)."""
+    clear = delete(rollup_table)
+    if user_id is not None:
+        clear = clear.where(rollup_table.c.user_id == user_id)
+    db.execute(clear)
+
+    inserted = 0
+    for bucket, fmt in BUCKETS.items():
+        start = func.strftime(fmt, SensorReading.timestamp)
+        cols = [func.count(getattr(SensorReading, m)) if agg == "count"
+                else func.coalesce(func.sum(getattr(SensorReading, m)), 0) if agg == "sum"
+                else getattr(func, agg)(getattr(SensorReading, m))
+                for m in ROLLUP_METRICS for agg in AGGREGATES]
+        source = (
+            select(literal(bucket, String), SensorReading.user_id, start, *cols)
+            .where(SensorReading.user_id.is_not(None), SensorReading.timestamp.is_not(None))
+            .group_by(SensorReading.user_id, start)
+        )
+        if user_id is not None:
+            source = source.where(SensorReading.user_id == user_id)
+        target = ["bucket", "user_id", "bucket_start"] + [f"{m}_{agg}" for m in ROLLUP_METRICS for agg in AGGREGATES]
+        inserted += db.execute(insert(rollup_table).from_select(target, source)).rowcount
+    return inserted
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Maintain sensor_rollups")
+    ap.add_argument("--backfill", action="store_true", help="rebuild rollups from sensor_readings")
+    ap.add_argument("--user-id", help="limit the backfill to one user")
+    args = ap.parse_args()
+    if not args.backfill:
+        ap.print_help()
+        return
+
+    db = SessionLocal()
+    try:
+        n = backfill_rollups(db, args.user_id)
+        db.commit()
+        print(f"Backfilled {n} rollup rows")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
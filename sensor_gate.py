@@ -0,0 +1,70 @@
+"""sensor_gate.py – decide when sensor data is worth a model response
+--------------------------------------------------------------------
+Every ``{"type":"sensor"}`` message used to cost one ``response.create``, so a
+watch sampling at 1 Hz triggered one billed model response per second.
+``SensorGate`` keeps a per-session stress estimate instead:
+
+• each sample is scored with ``compute_stress`` (a ``readings`` window with
+  the vectorised ``score_readings``) and folded into an EWMA
+  (``SENSOR_EWMA_ALPHA``);
+• a prompt is due when the EWMA crosses into another stress band, or when the
+  band is still elevated (medium/high) and ``SENSOR_COOLDOWN`` seconds have
+  passed since the last prompt;
+• prompts are never closer together than ``SENSOR_MIN_INTERVAL`` seconds.
+
+``check`` only reports that a prompt is due. The proxy calls ``mark`` once it
+has actually sent one, so a prompt held back by an active user response is
+retried on the next sample instead of being lost.
+"""
+
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from stress import STRESS_BANDS, STRESS_LABELS, compute_stress, score_readings
+
+SENSOR_EWMA_ALPHA   = float(os.getenv("SENSOR_EWMA_ALPHA", "0.3"))
+SENSOR_COOLDOWN     = float(os.getenv("SENSOR_COOLDOWN", "60"))
+SENSOR_MIN_INTERVAL = float(os.getenv("SENSOR_MIN_INTERVAL", "5"))
+
+
+def band_of(score: float) -> str:
+    for bound, label in zip(STRESS_BANDS, STRESS_LABELS):
+        if score < bound:
+            return str(label)
+    return str(STRESS_LABELS[-1])
+
+
+class SensorGate:
+    def __init__(self, alpha: float = SENSOR_EWMA_ALPHA, cooldown: float = SENSOR_COOLDOWN,
+                 min_interval: float = SENSOR_MIN_INTERVAL):
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.min_interval = min_interval
+        self.ewma: Optional[float] = None
+        self.band = "low"                 # band של ה-prompt האחרון; "low" = אין מה להגיד
+        self.last_prompt = float("-inf")
+
+    def update(self, msg: Dict[str, Any]) -> float:
+        """Fold one sensor message (single sample or ``readings`` window) into the EWMA."""
+        scores = score_readings(msg["readings"]) if msg.get("readings") else [compute_stress(msg)]
+        for x in scores:
+            x = float(x)
+            self.ewma = x if self.ewma is None else self.alpha * x + (1 - self.alpha) * self.ewma
+        return self.ewma if self.ewma is not None else 0.0
+
+    def check(self, now: Optional[float] = None) -> Optional[Tuple[float, str]]:
+        """``(score, band)`` if a prompt is due now, else ``None``."""
+        if self.ewma is None:
+            return None
+        now = time.monotonic() if now is None else now
+        if now - self.last_prompt < self.min_interval:
+            return None
+        band = band_of(self.ewma)
+        if band != self.band or (band != "low" and now - self.last_prompt >= self.cooldown):
+            return self.ewma, band
+        return None
+
+    def mark(self, band: str, now: Optional[float] = None) -> None:
+        self.band = band
+        self.last_prompt = time.monotonic() if now is None else now
@@ -1,61 +1,65 @@
+import asyncio
+import json
+import re
 import time
 from pathlib import Path
-import shutil
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Depends, Body
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, List, Optional
 from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
 from model import *
 from tamar import router as tamar_route
-from model import User, UserCreate, UserResponse, get_db
+from readings import router as readings_route
+from uploads import router as uploads_route
+from model import User, UserCreate, UserResponse, get_db, get_async_db
+from ingest import MAX_BATCH_READINGS, insert_readings, normalise_reading, publish_readings, reading_writer
+from live import live_store
+from alerts import alert_engine
+from fcm import build_message, fcm_dispatcher
+import os
+import queue
+from indicators import indicator_engine
 from openAI import Proxy as OpenAIProxy
+from stt import stt_pool
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 import logging
-from fastapi.requests import Request
-from fastapi.responses import Response
+from request_logging import RequestLoggingMiddleware, setup_logging
+from metrics import REGISTRY, MetricsMiddleware, instrument_engine
+from fastapi.responses import PlainTextResponse
 import firebase_admin
 from firebase_admin import credentials, messaging
-from model import router as model_router
-
-app.include_router(model_router, tags=["alerts"])
 
 START_TIME = time.time()
 
-cred = credentials.Certificate("../myphoneapp2025-firebase-adminsdk-fbsvc-af8b6574a1.json")
-firebase_admin.initialize_app(cred)
-
-logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
+setup_logging()
 log = logging.getLogger("server")
 
-app = FastAPI()
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    body = await request.body()
-    log.info(f"↘️  Request: {request.method} {request.url} | Body: {body.decode(errors='ignore')}")
-
-    response = await call_next(request)
-
-    process_time = (time.time() - start_time) * 1000
-    content = b""
-    if isinstance(body_iter, AsyncIterable):
-        async for chunk in body_iter:
-            content += chunk
-    else:
-        for chunk in body_iter:
-            content += chunk
-
-        # איפוס ה־body_iterator עם התוכן המלא
-        response.body_iterator = iter([content])
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "../myphoneapp2025-firebase-adminsdk-fbsvc-af8b6574a1.json")
+if Path(FIREBASE_CREDENTIALS).is_file():
+    cred = credentials.Certificate(FIREBASE_CREDENTIALS)
+    firebase_admin.initialize_app(cred)
+else:
+    # בלי credentials השרת עולה; הודעות FCM ייכשלו ויסומנו failed ב-/send-alert/{job_id}
+    log.warning(f"Firebase credentials not found at {FIREBASE_CREDENTIALS} – push notifications disabled")
 
-    log.info(f"↗️  Response: {request.method} {request.url.path} | status={response.status_code} | Time={process_time:.1f}ms | Body={content.decode(errors='ignore')}")
-    return response
+app = FastAPI()
+app.add_middleware(RequestLoggingMiddleware)
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+REGISTRY.gauge("readings_queue_depth", "Readings waiting for group commit",
+               fn=lambda: reading_writer.queue.qsize() if reading_writer.queue else 0)
+REGISTRY.gauge("fcm_queue_depth", "FCM messages waiting for dispatch", fn=fcm_dispatcher.depth)
+REGISTRY.gauge("stt_pending", "Speech-to-text jobs running or queued", fn=stt_pool.pending)
 
 app.include_router(tamar_route, tags=["events"])
+app.include_router(readings_route, tags=["readings"])
+app.include_router(uploads_route)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],            # allow browsers from any origin
@@ -77,20 +81,28 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
     return db_user
 
 @app.get("/users", response_model=List[UserResponse])
-def read_users(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    users = db.query(User).offset(skip).limit(limit).all()
+async def read_users(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_async_db)):
+    users = (await db.execute(select(User).offset(skip).limit(limit))).scalars().all()
     log.info(f"GET /users | skip={skip}, limit={limit} → Found: {len(users)} users")
     return users
 
 @app.get("/users/{user_id}", response_model=UserResponse)
-def read_user(user_id: int, db: Session = Depends(get_db)):
+async def read_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     log.info(f"GET /users/{user_id}")
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if user is None:
         log.warning(f"User {user_id} not found")
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+@app.get("/users/{user_id}/live")
+async def read_user_live(user_id: str, window: float = 300):
+    """Latest state + last ``window`` seconds of readings, served from memory (``live.py``)."""
+    snap = live_store.snapshot(user_id, window)
+    if snap is None:
+        raise HTTPException(status_code=404, detail="No live readings for user")
+    return snap
+
 class UserUpdate(BaseModel):
     name: Optional[str] = None
     email: Optional[str] = None
@@ -125,43 +137,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-UPLOAD_DIRECTORY = Path("uploaded_files")
-UPLOAD_DIRECTORY.mkdir(parents=True, exist_ok=True)
-
-
 @app.get("/")
 async def root():
     return {"message": "Welcome to FastAPI example!"}
 
 
-@app.post("/uploadfile")
-async def upload_file(file: UploadFile = File(...)):
-    if not file.filename:
-        raise HTTPException(status_code=400, detail="No file provided")
-    file_location = UPLOAD_DIRECTORY / file.filename
-    with open(file_location, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    # Reopen the file to read its content after saving
-
-    with open(file_location, "rb") as f:
-        content = f.read().strip()
-
-    result = {
-        "filename": file.filename,
-        "detail": "File uploaded successfully",
-        "content": content
-    }
-    return result
-
-
-@app.get("/downloadfile/{filename}")
-async def download_file(filename: str):
-    file_location = UPLOAD_DIRECTORY / filename
-    if not file_location.is_file():
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(path=file_location, filename=filename)
-
-
 # ────────────────────────── Pydantic schema ───────────────────────
 class SensorStatus(BaseModel):
     heart_rate: bool
@@ -213,18 +193,60 @@ def create_reading(
     db: Session = Depends(get_db)
 ):
     # אם מגיע גם heart_rate_bpm – נעדיף אותו אם heart_rate חסר
-    data = reading.model_dump(by_alias=True, exclude_unset=True)
-    if "heart_rate_bpm" in data and "heart_rate" not in data:
-        data["heart_rate"] = data.pop("heart_rate_bpm")
-        log.info(
-            f"[📡 SENSOR] user_id={data.get('user_id')} | heart_rate={data.get('heart_rate')} | stress_level={data.get('stress_level')}")
-
-    db_reading = SensorReading(**data)
-    db.add(db_reading)
+    data = normalise_reading(reading)
+    log.info(
+        f"[📡 SENSOR] user_id={data.get('user_id')} | heart_rate={data.get('heart_rate')} | stress_level={data.get('stress_level')}")
+
+    reading_id = insert_readings(db, [data])[0]
+    db.commit()
+    publish_readings([data], [reading_id])
+    log.info(f"[🧠 DB] Saved SensorReading: id={reading_id} | time={data.get('timestamp')}")
+    return {**data, "id": reading_id}
+
+
+class BatchReadingResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BatchReadingResponse(BaseModel):
+    inserted: int
+    failed: int
+    results: List[BatchReadingResult]
+
+
+@app.post("/readings/batch", response_model=BatchReadingResponse, status_code=201)
+def create_readings_batch(
+    readings: List[Dict[str, Any]] = Body(...),
+    db: Session = Depends(get_db)
+):
+    """Insert many readings in one transaction (offline buffers from the watch).
+
+    Every item is validated on its own, so one bad sample does not reject the
+    whole upload – it is reported back in ``results`` with its ``error``.
+    """
+    if len(readings) > MAX_BATCH_READINGS:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_READINGS})")
+
+    results = [BatchReadingResult(index=i) for i in range(len(readings))]
+    rows, positions = [], []
+    for i, item in enumerate(readings):
+        try:
+            rows.append(normalise_reading(SensorReadingCreate.model_validate(item)))
+            positions.append(i)
+        except ValidationError as e:
+            results[i].error = "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+    ids = insert_readings(db, rows)
     db.commit()
-    db.refresh(db_reading)
-    log.info(f"[🧠 DB] Saved SensorReading: id={db_reading.id} | time={db_reading.timestamp}")
-    return db_reading
+    publish_readings(rows, ids)
+    for i, reading_id in zip(positions, ids):
+        results[i].id = reading_id
+
+    log.info(f"[🧠 DB] Saved batch: {len(ids)} readings | {len(readings) - len(ids)} rejected")
+    return BatchReadingResponse(inserted=len(ids), failed=len(readings) - len(ids), results=results)
 
 class AlertRequest(BaseModel):
     token: str
@@ -233,21 +255,26 @@ class AlertRequest(BaseModel):
     data: dict | None = None
 
 
-@app.post("/send-alert")
+@app.post("/send-alert", status_code=202)
 async def send_alert(req: AlertRequest):
-    message_id = send_fcm_notification(
-        token=req.token,
-        title=req.title,
-        body=req.body,
-        data=req.data,
-    )
-    return {"success": True, "message_id": message_id}
+    """Queue the push and return immediately; poll ``/send-alert/{job_id}`` for the outcome."""
+    try:
+        job_id = fcm_dispatcher.submit(
+            build_message(title=req.title, body=req.body, data=req.data, token=req.token))
+    except queue.Full:
+        raise HTTPException(status_code=503, detail="Alert queue is full, retry later")
+    return {"success": True, "queued": True, "job_id": job_id}
+
+@app.get("/send-alert/{job_id}")
+async def send_alert_status(job_id: str):
+    status = fcm_dispatcher.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown alert job")
+    return status
 
 @app.get("/readings/{reading_id}", response_model=SensorReadingResponse)
-def get_reading(reading_id: int, db: Session = Depends(get_db)):
-    reading = db.query(SensorReading).filter(
-        SensorReading.id == reading_id
-    ).first()
+async def get_reading(reading_id: int, db: AsyncSession = Depends(get_async_db)):
+    reading = await db.get(SensorReading, reading_id)
     if not reading:
         raise HTTPException(status_code=404, detail="Reading not found")
     return reading
@@ -264,22 +291,131 @@ proxy = OpenAIProxy()
 async def realtime_ws(ws: WebSocket):
     await proxy.websocket_proxy(ws)
 
+@app.on_event("startup")
+async def start_realtime_proxy():
+    await proxy.start()
+
+@app.on_event("shutdown")
+async def stop_realtime_proxy():
+    await proxy.stop()
+
+if proxy.pool:
+    REGISTRY.gauge("openai_pool_idle", "Pre-warmed upstream connections ready", fn=proxy.pool.idle)
+REGISTRY.gauge("realtime_outbound_audio_bytes", "Audio bytes queued for realtime clients (all sessions)",
+               fn=lambda: sum(q["audio_bytes"] for q in proxy.queue_stats()))
+REGISTRY.gauge("realtime_outbound_max_items", "Deepest outbound queue of any realtime session",
+               fn=lambda: max((q["items"] for q in proxy.queue_stats()), default=0))
+
+@app.get("/v1/realtime/queues", tags=["Health"])
+async def realtime_queues():
+    """Outbound queue depth per open realtime session."""
+    return {"sessions": proxy.queue_stats()}
+
+# === Streaming sensor ingestion (write-behind, group commit) ===
+@app.on_event("startup")
+async def start_reading_writer():
+    reading_writer.start()
+
+@app.on_event("startup")
+async def warm_up_indicators():
+    def _load():
+        db = SessionLocal()
+        try:
+            indicator_engine.warm_up(db)
+        finally:
+            db.close()
+    await asyncio.to_thread(_load)
+
+@app.on_event("shutdown")
+async def stop_reading_writer():
+    await reading_writer.stop()
+
+
+@app.websocket("/v1/readings/stream")
+async def readings_stream(ws: WebSocket):
+    """Persistent ingestion socket for watches.
+
+    Each text frame is one ``SensorReadingCreate`` object or a JSON array of
+    them. Frames are numbered from 1 and answered in order with
+    ``{"type":"ack","seq":n,"ids":[...]}`` once committed, or
+    ``{"type":"error","seq":n,"error":"..."}``.
+    """
+    await ws.accept()
+    acks: asyncio.Queue = asyncio.Queue()
+    sender = asyncio.create_task(_send_stream_acks(ws, acks))
+    seq = 0
+    try:
+        async for raw in ws.iter_text():
+            seq += 1
+            try:
+                payload = json.loads(raw)
+                items = payload if isinstance(payload, list) else [payload]
+                rows = [normalise_reading(SensorReadingCreate.model_validate(i)) for i in items]
+            except (ValueError, ValidationError) as e:
+                await acks.put((seq, None, str(e)))
+                continue
+            futures = [await reading_writer.submit(row) for row in rows]
+            await acks.put((seq, futures, None))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await acks.put(None)
+        await sender
+    log.info(f"[📡 STREAM] closed after {seq} frames")
+
+
+async def _send_stream_acks(ws: WebSocket, acks: asyncio.Queue):
+    while (item := await acks.get()) is not None:
+        seq, futures, error = item
+        if futures is not None:
+            try:
+                ids = [await f for f in futures]
+            except Exception as e:
+                error = f"write failed: {e}"
+        msg = {"type": "error", "seq": seq, "error": error} if error else \
+              {"type": "ack", "seq": seq, "ids": ids}
+        try:
+            await ws.send_json(msg)
+        except Exception:
+            # הלקוח התנתק – ממשיכים לרוקן את התור כדי שהכתיבות יסתיימו
+            pass
+
 @app.get("/health")
 async def health_proxy():
     return {"mode": "OpenAI" if proxy.use_ai else "local","status":"ok"}
 
 
-def send_fcm_notification(token: str, title: str, body: str, data: dict | None = None) -> str:
-    """
-    שולחת הודעת פוש ל־FCM.
-    מחזירה את message_id של FCM.
-    """
-    message = messaging.Message(
-        notification=messaging.Notification(title=title, body=body),
-        data=data or {},
-        token=token,
-    )
-    return messaging.send(message)
+# התראות מה-ingest נשלחות ל-topic של המשתמש דרך תור ה-FCM
+ALERT_TOPIC_PREFIX = os.getenv("ALERT_TOPIC_PREFIX", "alerts_")
+
+def push_ingest_alert(alert: dict) -> None:
+    topic = ALERT_TOPIC_PREFIX + re.sub(r"[^A-Za-z0-9_.~%-]", "_", str(alert["user_id"]))
+    data = {k: v for k, v in alert.items() if v is not None}
+    try:
+        fcm_dispatcher.submit(build_message(alert["title"], alert["body"], data, topic=topic))
+    except queue.Full:
+        log.warning(f"FCM queue full – dropped alert {alert['rule']} for {alert['user_id']}")
+
+alert_engine.notify = push_ingest_alert
+
+
+@app.on_event("startup")
+async def start_fcm_dispatcher():
+    fcm_dispatcher.start()
+
+@app.on_event("shutdown")
+async def stop_fcm_dispatcher():
+    await asyncio.to_thread(fcm_dispatcher.stop)
+
+@app.on_event("shutdown")
+async def stop_stt_pool():
+    stt_pool.shutdown()
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+async def metrics():
+    """Prometheus text exposition of the in-process registry (``metrics.py``)."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/health", tags=["Health"])
@@ -0,0 +1,96 @@
+"""stress.py – stress score for single messages and whole batches
+----------------------------------------------------------------
+``compute_stress`` is the per-message score the realtime proxy has always used:
+0.6·rage + 0.4·(HR above 75 bpm, saturating at +40). ``compute_stress_batch``
+evaluates the same formula over NumPy columns, so an ingest batch or a
+historical window is scored in one call instead of one Python loop per sample.
+
+HRV and EDA terms are supported but weighted 0 by default, which keeps scores
+identical to the original formula; tune them with ``STRESS_HRV_WEIGHT`` /
+``STRESS_EDA_WEIGHT``.
+"""
+
+import os
+from typing import Any, Dict, Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+RAGE_WEIGHT = float(os.getenv("STRESS_RAGE_WEIGHT", "0.6"))
+HR_WEIGHT   = float(os.getenv("STRESS_HR_WEIGHT", "0.4"))
+HRV_WEIGHT  = float(os.getenv("STRESS_HRV_WEIGHT", "0.0"))
+EDA_WEIGHT  = float(os.getenv("STRESS_EDA_WEIGHT", "0.0"))
+
+HR_REST, HR_SPAN   = 75.0, 40.0      # bpm
+HRV_REF            = 50.0            # ms – מתחת לזה HRV נחשב ירוד
+EDA_REST, EDA_SPAN = 2.0, 10.0       # µS
+
+# גבולות רמות הלחץ (stress_level) לפי הציון
+STRESS_BANDS = (0.33, 0.66)
+STRESS_LABELS = np.array(["low", "medium", "high"])
+
+ArrayLike = Union[Sequence[Optional[float]], np.ndarray]
+
+
+def _column(values: Optional[ArrayLike], n: int) -> np.ndarray:
+    """Float column with ``None`` → NaN; missing column → all NaN."""
+    if values is None:
+        return np.full(n, np.nan)
+    return np.asarray(values, dtype=float)
+
+
+def compute_stress_batch(
+    heart_rate: ArrayLike,
+    rage_probability: ArrayLike,
+    hrv_ms: Optional[ArrayLike] = None,
+    eda_microsiemens: Optional[ArrayLike] = None,
+) -> np.ndarray:
+    """Vectorised stress score in ``[0, 1]``; missing inputs contribute nothing."""
+    hr = _column(heart_rate, len(heart_rate))
+    n = hr.shape[0]
+    rage = np.nan_to_num(_column(rage_probability, n)) / 100
+    hr_term = np.clip(np.nan_to_num(hr, nan=HR_REST) - HR_REST, 0, None) / HR_SPAN
+
+    score = RAGE_WEIGHT * rage + HR_WEIGHT * hr_term
+    if HRV_WEIGHT:
+        hrv = _column(hrv_ms, n)
+        score += HRV_WEIGHT * np.clip((HRV_REF - np.nan_to_num(hrv, nan=HRV_REF)) / HRV_REF, 0, 1)
+    if EDA_WEIGHT:
+        eda = _column(eda_microsiemens, n)
+        score += EDA_WEIGHT * np.clip((np.nan_to_num(eda, nan=EDA_REST) - EDA_REST) / EDA_SPAN, 0, 1)
+    return np.minimum(1.0, score)
+
+
+def _field(r: Any, name: str):
+    return r.get(name) if isinstance(r, dict) else getattr(r, name, None)
+
+
+def score_readings(readings: Iterable[Union[Dict[str, Any], Any]]) -> np.ndarray:
+    """Score a list of reading dicts / ``SensorReading`` rows in one call."""
+    readings = list(readings)
+    hr = [_field(r, "heart_rate") if _field(r, "heart_rate") is not None else _field(r, "heart_rate_bpm")
+          for r in readings]
+    return compute_stress_batch(
+        hr,
+        [_field(r, "rage_probability") for r in readings],
+        [_field(r, "hrv_ms") for r in readings],
+        [_field(r, "eda_microsiemens") for r in readings],
+    )
+
+
+def stress_band(scores: np.ndarray) -> np.ndarray:
+    """Scores → ``"low" | "medium" | "high"`` labels."""
+    return STRESS_LABELS[np.digitize(scores, STRESS_BANDS)]
+
+
+def compute_stress(s: Dict[str, Any]) -> float:
+    """Single-message score (same formula as the batch version)."""
+    return float(score_readings([s])[0])
+
+
+def apply_stress_levels(rows: Sequence[Dict[str, Any]]) -> None:
+    """Fill ``stress_level`` in place for rows that arrived without one."""
+    missing = [r for r in rows if r.get("stress_level") is None]
+    if not missing:
+        return
+    for row, label in zip(missing, stress_band(score_readings(missing))):
+        row["stress_level"] = str(label)
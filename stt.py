@@ -6,9 +6,24 @@ dependencies:  pip install SpeechRecognition
                # אם תרצי לעבוד עם מיקרופון גם → pip install pipwin && pipwin install pyaudio
 """
 
+import asyncio
+import io
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import speech_recognition as sr
 
+STT_WORKERS     = int(os.getenv("STT_WORKERS", "4"))
+STT_MAX_PENDING = int(os.getenv("STT_MAX_PENDING", "16"))      # רצים + ממתינים, לכל ה-workers
+STT_SAMPLE_RATE = int(os.getenv("STT_SAMPLE_RATE", "16000"))    # PCM16 גולמי מהלקוח
+AUDIO_FILE_MAGIC = (b"RIFF", b"FORM", b"fLaC")                  # WAV / AIFF / FLAC
+
+
+def is_audio_file(audio: bytes) -> bool:
+    """True if ``audio`` starts with a WAV/AIFF/FLAC header rather than raw PCM."""
+    return audio[:4] in AUDIO_FILE_MAGIC
+
 
 def speech_to_text(input_file: str, lang: str = "en-US") -> str:
     """
@@ -40,6 +55,69 @@ def speech_to_text(input_file: str, lang: str = "en-US") -> str:
         return f"Transcription error: {e}"
 
 
+def speech_to_text_bytes(audio: bytes, lang: str = "en-US",
+                         sample_rate: int = STT_SAMPLE_RATE, sample_width: int = 2) -> str:
+    """
+    Same as ``speech_to_text`` but from memory – no temp file.
+
+    ``audio`` is either a complete WAV/AIFF/FLAC file (detected by its header)
+    or raw mono PCM at ``sample_rate`` / ``sample_width``.
+    """
+    recognizer = sr.Recognizer()
+    try:
+        if is_audio_file(audio):
+            with sr.AudioFile(io.BytesIO(audio)) as source:
+                audio_data = recognizer.record(source)
+        else:
+            audio_data = sr.AudioData(audio, sample_rate, sample_width)
+
+        return recognizer.recognize_google(audio_data, language=lang)
+
+    except Exception as e:
+        return f"Transcription error: {e}"
+
+
+class SttBusy(RuntimeError):
+    """Raised when ``STT_MAX_PENDING`` transcriptions are already running or queued."""
+
+
+class SttPool:
+    """
+    Bounded thread pool for blocking recognition calls.
+
+    ``transcribe`` runs ``speech_to_text_bytes`` off the event loop. At most
+    ``max_pending`` jobs may be running or waiting; beyond that it raises
+    ``SttBusy`` at once instead of letting the backlog grow.
+    """
+
+    def __init__(self, workers: int = STT_WORKERS, max_pending: int = STT_MAX_PENDING):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stt")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def pending(self) -> int:
+        return self._pending
+
+    async def transcribe(self, audio: bytes, lang: str = "en-US") -> str:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise SttBusy(f"{self._pending} transcriptions pending")
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, speech_to_text_bytes, audio, lang)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+stt_pool = SttPool()
+
+
 # ---------------------------------------------------------------------------
 #  CLI
 # ---------------------------------------------------------------------------
@@ -17,10 +17,11 @@ from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, Field
-from sqlalchemy import Column, DateTime, Integer, String, Text
+from sqlalchemy import Column, DateTime, Integer, String, Text, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from model import Base, engine, get_db  # type: ignore
+from model import Base, engine, get_async_db, get_db  # type: ignore
 
 # ───────────────────────────── SQLAlchemy model ────────────────────────────────
 class Event(Base):
@@ -66,23 +67,23 @@ router = APIRouter(prefix="/events", tags=["events"])
 
 # ─────────────── General listing ───────────────
 @router.get("/", response_model=List[EventResponse], status_code=status.HTTP_200_OK)
-def list_events(
+async def list_events(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Return **all** events (paginated)."""
 
-    events = db.query(Event).offset(skip).limit(limit).all()
+    events = (await db.execute(select(Event).offset(skip).limit(limit))).scalars().all()
     return events
 
 
 # ─────────────── Single event by ID ───────────────
 @router.get("/{event_id}", response_model=EventResponse, status_code=status.HTTP_200_OK)
-def get_event(event_id: int, db: Session = Depends(get_db)):
+async def get_event(event_id: int, db: AsyncSession = Depends(get_async_db)):
     """Return a **single** event by primary key."""
 
-    event = db.query(Event).filter(Event.id == event_id).first()
+    event = await db.get(Event, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     return event
@@ -94,37 +95,42 @@ def get_event(event_id: int, db: Session = Depends(get_db)):
     response_model=List[EventResponse],
     status_code=status.HTTP_200_OK,
 )
-def check_for_tamar_status(user_id: int, db: Session = Depends(get_db)):
+async def check_for_tamar_status(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Return **all events** (possibly *zero*) for the given ``user_id``.
     If no events exist, an **empty list** is returned with HTTP 200 (OK).
     """
 
     events = (
-        db.query(Event)
-        .filter(Event.user_id == user_id)
-        .order_by(Event.timestamp.desc())
-        .all()
-    )
+        await db.execute(
+            select(Event)
+            .where(Event.user_id == user_id)
+            .order_by(Event.timestamp.desc())
+        )
+    ).scalars().all()
 
     # No error raising – simply return the (possibly empty) list
     return events
 
 
+# ─────────────── Create (manual events; rule-based ones come from alerts.py) ───────────────
+@router.post("/", response_model=EventResponse, status_code=status.HTTP_201_CREATED)
+def create_event(event: EventCreate, db: Session = Depends(get_db)):
+    """Persist a new event; ``timestamp`` defaults to UTC now."""
+
+    data = event.model_dump(exclude_unset=True)
+    if not data.get("timestamp"):
+        data["timestamp"] = datetime.utcnow()
+    db_event = Event(**data)
+    db.add(db_event)
+    db.commit()
+    db.refresh(db_event)
+    return db_event
+
+
 # ─────────────────────────────── Future endpoints ──────────────────────────────
 # Uncomment/extend as needed
 # -----------------------------------------------------------------------------
 #
-# @router.post("/", response_model=EventResponse, status_code=status.HTTP_201_CREATED)
-# def create_event(event: EventCreate, db: Session = Depends(get_db)):
-#     data = event.dict(exclude_unset=True)
-#     if not data.get("timestamp"):
-#         data["timestamp"] = datetime.utcnow()
-#     db_event = Event(**data)
-#     db.add(db_event)
-#     db.commit()
-#     db.refresh(db_event)
-#     return db_event
-#
 # @router.delete("/{event_id}", response_model=EventResponse, status_code=status.HTTP_200_OK)
 # def delete_event(event_id: int, db: Session = Depends(get_db)):
 #     event = db.query(Event).filter(Event.id == event_id).first()
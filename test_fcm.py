@@ -0,0 +1,118 @@
+"""test_fcm.py – FcmDispatcher against a stubbed messaging backend (pytest)"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from firebase_admin import exceptions, messaging
+
+from fcm import FcmDispatcher, build_message
+
+
+class StubBackend:
+    """``send_each`` stand-in: ``outcomes[token]`` is a list of exceptions / None (success), used in order."""
+
+    def __init__(self, outcomes=None):
+        self.outcomes = outcomes or {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def send_each(self, messages):
+        with self.lock:
+            self.calls.append([m.token for m in messages])
+            responses = []
+            for m in messages:
+                plan = self.outcomes.get(m.token) or [None]
+                err = plan.pop(0) if len(plan) > 1 else plan[0]
+                responses.append(SimpleNamespace(success=err is None, exception=err,
+                                                 message_id=None if err else f"msg-{m.token}"))
+        return SimpleNamespace(responses=responses)
+
+
+def wait_for(dispatcher, job_id, states, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        st = dispatcher.status(job_id)
+        if st and st["status"] in states:
+            return st
+        time.sleep(0.01)
+    pytest.fail(f"job {job_id} stuck in {dispatcher.status(job_id)}")
+
+
+@pytest.fixture
+def make_dispatcher():
+    started = []
+
+    def make(backend, **kw):
+        d = FcmDispatcher(backend=backend, workers=1, base_delay=0.01, max_delay=0.05, **kw)
+        d.start()
+        started.append(d)
+        return d
+
+    yield make
+    for d in started:
+        d.stop()
+
+
+def msg(token):
+    return build_message("title", "body", {"k": 1}, token=token)
+
+
+def test_sent(make_dispatcher):
+    d = make_dispatcher(StubBackend())
+    st = wait_for(d, d.submit(msg("ok")), {"sent"})
+    assert st["message_id"] == "msg-ok" and st["attempts"] == 1
+
+
+def test_unregistered_token_is_remembered(make_dispatcher):
+    backend = StubBackend({"gone": [messaging.UnregisteredError("unregistered")]})
+    d = make_dispatcher(backend)
+    wait_for(d, d.submit(msg("gone")), {"invalid_token"})
+    calls = len(backend.calls)
+    st = d.status(d.submit(msg("gone")))
+    assert st["status"] == "invalid_token"
+    assert len(backend.calls) == calls          # לא נשלח שוב
+
+
+def test_invalid_argument_does_not_blacklist_token(make_dispatcher):
+    backend = StubBackend({"dev": [exceptions.InvalidArgumentError("bad payload"), None]})
+    d = make_dispatcher(backend)
+    assert wait_for(d, d.submit(msg("dev")), {"failed", "invalid_token"})["status"] == "failed"
+    assert wait_for(d, d.submit(msg("dev")), {"sent", "invalid_token"})["status"] == "sent"
+
+
+def test_transient_errors_are_retried(make_dispatcher):
+    backend = StubBackend({"flaky": [exceptions.UnavailableError("503"),
+                                     exceptions.InternalError("500"), None]})
+    d = make_dispatcher(backend)
+    st = wait_for(d, d.submit(msg("flaky")), {"sent", "failed"})
+    assert st["status"] == "sent" and st["attempts"] == 3
+
+
+def test_retries_give_up(make_dispatcher):
+    backend = StubBackend({"down": [exceptions.UnavailableError("503")]})
+    d = make_dispatcher(backend, max_retries=2)
+    st = wait_for(d, d.submit(msg("down")), {"sent", "failed"})
+    assert st["status"] == "failed" and st["attempts"] == 3
+
+
+def test_batches_with_send_each():
+    backend = StubBackend()
+    d = FcmDispatcher(backend=backend, workers=1, batch_size=10)
+    ids = [d.submit(msg(f"t{i}")) for i in range(25)]      # בתור לפני שה-worker מתחיל
+    d.start()
+    try:
+        for job_id in ids:
+            wait_for(d, job_id, {"sent"})
+    finally:
+        d.stop()
+    assert [len(c) for c in backend.calls] == [10, 10, 5]
+
+
+def test_invalid_tokens_are_bounded(make_dispatcher):
+    backend = StubBackend({f"g{i}": [messaging.UnregisteredError("unregistered")] for i in range(5)})
+    d = make_dispatcher(backend, max_invalid_tokens=3)
+    for i in range(5):
+        wait_for(d, d.submit(msg(f"g{i}")), {"invalid_token"})
+    assert list(d._invalid_tokens) == ["g2", "g3", "g4"]
@@ -0,0 +1,93 @@
+"""test_ingest.py – ReadingWriter shutdown with a stubbed write (pytest)"""
+
+import asyncio
+import threading
+
+import pytest
+
+from ingest import ReadingWriter
+
+
+class StubWriter(ReadingWriter):
+    """``_write`` stand-in: records committed rows; ``fail`` / ``gate`` control the outcome."""
+
+    def __init__(self, fail=None, **kw):
+        super().__init__(**kw)
+        self.fail = fail
+        self.committed = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def _write(self, rows):
+        self.gate.wait(5)
+        if self.fail:
+            raise self.fail
+        start = len(self.committed)
+        self.committed.extend(rows)
+        return list(range(start + 1, start + 1 + len(rows)))
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_stop_commits_partial_batch():
+    async def scenario():
+        w = StubWriter(batch_size=500, flush_ms=1000)
+        w.start()
+        futures = [await w.submit({"n": i}) for i in range(10)]
+        await asyncio.sleep(0.05)            # ה-writer כבר משך את השורות לקבוצה המקומית שלו
+        await w.stop()
+        return w, futures
+
+    w, futures = run(scenario())
+    assert all(f.done() for f in futures)
+    assert [f.result() for f in futures] == list(range(1, 11))
+    assert [r["n"] for r in w.committed] == list(range(10))
+
+
+def test_stop_commits_rows_submitted_after_sentinel():
+    async def scenario():
+        w = StubWriter(batch_size=2, flush_ms=1000)
+        w.start()
+        w.gate.clear()                       # הקבוצה הראשונה תקועה ב-commit
+        first = [await w.submit({"n": i}) for i in range(2)]
+        await asyncio.sleep(0.05)
+        stopping = asyncio.create_task(w.stop())
+        await asyncio.sleep(0)
+        late = await w.submit({"n": 2})
+        w.gate.set()
+        await stopping
+        return first + [late]
+
+    futures = run(scenario())
+    assert [f.result() for f in futures] == [1, 2, 3]
+
+
+def test_failed_write_fails_every_future():
+    async def scenario():
+        w = StubWriter(fail=RuntimeError("disk full"), batch_size=500, flush_ms=1000)
+        w.start()
+        futures = [await w.submit({"n": i}) for i in range(3)]
+        await w.stop()
+        return futures
+
+    for f in run(scenario()):
+        with pytest.raises(RuntimeError, match="disk full"):
+            f.result()
+
+
+def test_cancelled_writer_resolves_futures():
+    async def scenario():
+        w = StubWriter(batch_size=500, flush_ms=1000)
+        w.start()
+        futures = [await w.submit({"n": i}) for i in range(3)]
+        await asyncio.sleep(0.05)
+        w._task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await w._task
+        return futures
+
+    for f in run(scenario()):
+        with pytest.raises(RuntimeError, match="stopped before commit"):
+            f.result()
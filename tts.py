@@ -1,13 +1,36 @@
 import asyncio
 import edge_tts
 import os
+from typing import AsyncIterator
 
-async def text_to_speech(text: str, output_file: str = "output.mp3") -> None:
+DEFAULT_VOICE = "en-US-AriaNeural"   # male? use "en-US-GuyNeural"
+
+async def text_to_speech(text: str, output_file: str = "output.mp3", voice: str = DEFAULT_VOICE) -> None:
     """Synthesize English speech with Microsoft Edge-TTS and save to MP3."""
-    communicate = edge_tts.Communicate(text, voice="en-US-AriaNeural")  # male? use "en-US-GuyNeural"
+    communicate = edge_tts.Communicate(text, voice=voice)
     await communicate.save(output_file)
     print(f"Saved to: {output_file}")
 
+async def stream_speech(text: str, voice: str = DEFAULT_VOICE, min_chunk: int = 0) -> AsyncIterator[bytes]:
+    """Yield MP3 bytes from Edge-TTS as they arrive, in memory.
+
+    The first chunk is yielded immediately; later ones are merged until they
+    reach ``min_chunk`` bytes, so callers don't send hundreds of tiny frames.
+    """
+    communicate = edge_tts.Communicate(text, voice=voice)
+    pending = bytearray()
+    first = True
+    async for chunk in communicate.stream():
+        if chunk["type"] != "audio":
+            continue                      # WordBoundary וכו'
+        pending += chunk["data"]
+        if first or len(pending) >= min_chunk:
+            first = False
+            yield bytes(pending)
+            pending.clear()
+    if pending:
+        yield bytes(pending)
+
 def main() -> None:
     text = input("Enter text to synthesize: ").strip()
     output_file = "output.mp3"
@@ -0,0 +1,211 @@
+"""tts_cache.py – content-addressed cache in front of Edge-TTS
+-------------------------------------------------------------
+Alerts and coaching prompts repeat a small set of phrases, and each one used
+to be a network synthesis round-trip. ``TtsCache`` keys audio by
+sha256(voice, format, text) and keeps it in two tiers:
+
+• memory – an LRU bounded by total bytes (``TTS_CACHE_MEMORY_MAX``); a hit is a
+  dict lookup;
+• disk – ``TTS_CACHE_DIR/<sha256>.mp3``, bounded by ``TTS_CACHE_DISK_MAX``, with
+  the least recently used files evicted first. Disk hits are promoted to
+  memory.
+
+Concurrent requests for the same key share one synthesis (single-flight):
+the first caller streams from Edge-TTS and fills the cache, and the rest wait
+for its result. ``warm_up`` synthesises a phrase list at startup
+(``TTS_WARM_PHRASES`` – a file with one phrase per line).
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, Optional
+
+from metrics import TTS_CACHE
+from tts import DEFAULT_VOICE, stream_speech
+
+log = logging.getLogger("tts-cache")
+
+TTS_CACHE_MEMORY_MAX = int(os.getenv("TTS_CACHE_MEMORY_MAX", str(32 * 1024 * 1024)))
+TTS_CACHE_DISK_MAX   = int(os.getenv("TTS_CACHE_DISK_MAX", str(512 * 1024 * 1024)))
+TTS_CACHE_DIR        = os.getenv("TTS_CACHE_DIR", ".tts_cache")
+TTS_WARM_PHRASES     = os.getenv("TTS_WARM_PHRASES", "")
+REPLAY_CHUNK         = 16 * 1024        # גודל delta כשמנגנים אודיו מה-cache
+
+DEFAULT_PHRASES = (
+    "Take a deep breath.",
+    "Take a deep breath. You are doing fine.",
+    "Your stress level is rising. Let's slow down together.",
+)
+
+
+def cache_key(text: str, voice: str = DEFAULT_VOICE, fmt: str = "mp3") -> str:
+    return hashlib.sha256(f"{voice}\0{fmt}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _chunks(data: bytes, size: int) -> Iterable[bytes]:
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class TtsCache:
+    def __init__(self, directory: str = TTS_CACHE_DIR, memory_max: int = TTS_CACHE_MEMORY_MAX,
+                 disk_max: int = TTS_CACHE_DISK_MAX):
+        self.memory_max = memory_max
+        self.disk_max = disk_max
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.dir = Path(directory) if directory else None
+        # אינדקס הדיסק: key → size, לפי סדר שימוש (הישן ביותר ראשון)
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        if self.dir and self.dir.is_dir():
+            for f in sorted(self.dir.glob("*.mp3"), key=lambda p: p.stat().st_mtime):
+                self._disk[f.stem] = f.stat().st_size
+                self._disk_bytes += self._disk[f.stem]
+
+    # ---------- tiers ----------
+    def _mem_get(self, key: str) -> Optional[bytes]:
+        data = self._mem.get(key)
+        if data is not None:
+            self._mem.move_to_end(key)
+        return data
+
+    def _mem_put(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_max:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= len(old)
+        self._mem[key] = data
+        self._mem_bytes += len(data)
+        while self._mem_bytes > self.memory_max:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= len(evicted)
+
+    def _path(self, key: str) -> Path:
+        return self.dir / f"{key}.mp3"
+
+    def _disk_read(self, key: str) -> Optional[bytes]:
+        try:
+            data = self._path(key).read_bytes()
+        except OSError:
+            return None
+        os.utime(self._path(key))       # mtime = שימוש אחרון, לסדר ה-LRU אחרי restart
+        return data
+
+    def _disk_write(self, key: str, data: bytes) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(key).with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, self._path(key))
+
+    def _unlink(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    async def lookup(self, key: str) -> Optional[bytes]:
+        data = self._mem_get(key)
+        if data is not None:
+            TTS_CACHE.inc(outcome="memory")
+            return data
+        if self.dir and key in self._disk:
+            data = await asyncio.to_thread(self._disk_read, key)
+            if data is not None:
+                self._disk.move_to_end(key)
+                self._mem_put(key, data)
+                TTS_CACHE.inc(outcome="disk")
+                return data
+            self._disk_bytes -= self._disk.pop(key, 0)
+        return None
+
+    async def store(self, key: str, data: bytes) -> None:
+        self._mem_put(key, data)
+        if not self.dir or key in self._disk:
+            return
+        try:
+            await asyncio.to_thread(self._disk_write, key, data)
+        except OSError as e:
+            log.warning("TTS cache disk write failed: %s", e)
+            return
+        self._disk[key] = len(data)
+        self._disk_bytes += len(data)
+        # האינדקס מתעדכן ב-event loop; רק מחיקת הקבצים עוברת ל-thread
+        victims = []
+        while self._disk_bytes > self.disk_max and self._disk:
+            old, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            victims.append(old)
+        if victims:
+            await asyncio.to_thread(self._unlink, victims)
+
+    # ---------- API ----------
+    async def stream(self, text: str, voice: str = DEFAULT_VOICE, min_chunk: int = 0) -> AsyncIterator[bytes]:
+        """MP3 chunks for ``text`` – from the cache, a shared in-flight synthesis, or Edge-TTS."""
+        key = cache_key(text, voice)
+        data = await self.lookup(key)
+        if data is None and key in self._inflight:
+            try:
+                data = await asyncio.shield(self._inflight[key])
+                TTS_CACHE.inc(outcome="shared")
+            except Exception:
+                data = None             # הסינתזה המשותפת נכשלה – מנסים בעצמנו
+        if data is not None:
+            for chunk in _chunks(data, max(min_chunk, REPLAY_CHUNK)):
+                yield chunk
+            return
+
+        TTS_CACHE.inc(outcome="miss")
+        fut = self._inflight.get(key)
+        owner = fut is None         # אחרת מישהו אחר כבר מסנתז – ולא נסתנכרן עליו שוב
+        if owner:
+            fut = self._inflight[key] = asyncio.get_running_loop().create_future()
+        parts = []
+        try:
+            async for chunk in stream_speech(text, voice, min_chunk):
+                parts.append(chunk)
+                yield chunk
+            data = b"".join(parts)
+            if owner:
+                fut.set_result(data)
+            await self.store(key, data)
+        finally:
+            if owner:
+                if not fut.done():
+                    fut.set_exception(RuntimeError("TTS synthesis aborted"))
+                    fut.exception()     # מסמן שנקרא – בלי אזהרת asyncio אם אין ממתינים
+                self._inflight.pop(key, None)
+
+    async def get(self, text: str, voice: str = DEFAULT_VOICE) -> bytes:
+        """Whole MP3 for ``text``."""
+        return b"".join([c async for c in self.stream(text, voice)])
+
+    async def warm_up(self, phrases: Iterable[str], voice: str = DEFAULT_VOICE) -> int:
+        """Synthesise ``phrases`` that are not cached yet; returns how many were added."""
+        added = 0
+        for phrase in phrases:
+            key = cache_key(phrase, voice)
+            if key in self._mem or key in self._disk:
+                continue
+            try:
+                await self.get(phrase, voice)
+                added += 1
+            except Exception as e:
+                log.warning("TTS warm-up failed for %r: %s", phrase, e)
+        return added
+
+
+def warm_phrases(path: str = TTS_WARM_PHRASES) -> Iterable[str]:
+    if path and Path(path).is_file():
+        return [l.strip() for l in Path(path).read_text(encoding="utf-8").splitlines() if l.strip()]
+    return DEFAULT_PHRASES
+
+
+tts_cache = TtsCache()
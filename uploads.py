@@ -0,0 +1,303 @@
+"""uploads.py – streaming, resumable uploads and Range downloads
+---------------------------------------------------------------
+Devices upload multi-megabyte audio clips over flaky links. Every route here
+writes in ``UPLOAD_CHUNK`` pieces on a worker thread and hashes (sha256) as
+the data arrives. Uploads stop with 413 once ``UPLOAD_MAX_BYTES`` is exceeded,
+and responses carry metadata only, never the file contents.
+
+Routes:
+• ``POST /uploadfile`` – multipart upload, as before.
+• ``PUT /uploadfile/{filename}`` – raw request body, streamed to disk.
+• Resumable protocol:
+    ``POST   /uploads``                  ``{"filename", "size"?, "sha256"?}`` → ``upload_id``
+    ``PUT    /uploads/{id}?offset=N``    append a chunk at ``N``; a wrong offset → 409
+                                         with the current one
+    ``GET    /uploads/{id}``             current offset (resume point)
+    ``POST   /uploads/{id}/complete``    verify size/sha256 and publish the file
+    ``DELETE /uploads/{id}``             abort
+  Parts live in ``UPLOAD_DIRECTORY/.partial`` next to a JSON meta file, so an
+  upload survives a server restart. The offset is always the part file's size.
+• ``GET /downloadfile/{filename}`` – Starlette's ``FileResponse``: ``ETag`` /
+  ``Last-Modified``, ``Range`` (206 / 416) and ``If-Range``; plus
+  ``If-None-Match`` (304).
+
+Usage (in ``server.py``):
+>>> from uploads import router as uploads_router
+>>> app.include_router(uploads_router)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import APIRouter, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import FileResponse, Response
+from pydantic import BaseModel
+
+UPLOAD_DIRECTORY = Path(os.getenv("UPLOAD_DIR", "uploaded_files"))
+PARTIAL_DIRECTORY = UPLOAD_DIRECTORY / ".partial"
+UPLOAD_DIRECTORY.mkdir(parents=True, exist_ok=True)
+PARTIAL_DIRECTORY.mkdir(parents=True, exist_ok=True)
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+UPLOAD_CHUNK     = int(os.getenv("UPLOAD_CHUNK", str(1024 * 1024)))
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))   # uploads נטושים
+
+router = APIRouter(tags=["files"])
+
+
+# ───────────────────────────── Pydantic schemas ────────────────────────────────
+class FileInfo(BaseModel):
+    filename: str
+    size: int
+    sha256: str
+    detail: str = "File uploaded successfully"
+
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: Optional[int] = None          # אם ידוע – נאכף ב-PUT וב-complete
+    sha256: Optional[str] = None        # אם ידוע – נבדק ב-complete
+
+
+class UploadStatus(BaseModel):
+    upload_id: str
+    filename: str
+    offset: int
+    size: Optional[int] = None
+    chunk_size: int = UPLOAD_CHUNK
+
+
+# ───────────────────────────────── helpers ─────────────────────────────────────
+def safe_name(filename: str) -> str:
+    """Basename only – no directories, no hidden names (``.partial``, temp files, ``..``)."""
+    name = Path(filename or "").name
+    if not name or name.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid file name")
+    return name
+
+
+def _append(path: Path, data: bytes) -> None:
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+def _hash_file(path: Path) -> "hashlib._Hash":
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK), b""):
+            h.update(block)
+    return h
+
+
+async def write_stream(chunks: AsyncIterator[bytes], path: Path, hasher, start: int = 0,
+                       limit: int = UPLOAD_MAX_BYTES) -> int:
+    """Append ``chunks`` to ``path`` off the event loop; returns the new size.
+
+    Small network chunks are gathered up to ``UPLOAD_CHUNK`` before each write.
+    Exceeding ``limit`` (counting ``start``) raises 413; whatever was written
+    stays in place, so a resumable upload keeps its offset.
+    """
+    size = start
+    pending = bytearray()
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if size + len(pending) + len(chunk) > limit:
+            if pending:
+                await asyncio.to_thread(_append, path, bytes(pending))
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"Upload exceeds {limit} bytes")
+        hasher.update(chunk)
+        pending += chunk
+        if len(pending) >= UPLOAD_CHUNK:
+            await asyncio.to_thread(_append, path, bytes(pending))
+            size += len(pending)
+            pending.clear()
+    if pending:
+        await asyncio.to_thread(_append, path, bytes(pending))
+        size += len(pending)
+    return size
+
+
+async def _upload_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _save_whole(name: str, chunks: AsyncIterator[bytes]) -> FileInfo:
+    """Write into a temp name, then atomically replace the target."""
+    tmp = UPLOAD_DIRECTORY / f".{name}.{uuid.uuid4().hex}.tmp"
+    hasher = hashlib.sha256()
+    try:
+        size = await write_stream(chunks, tmp, hasher)
+        if size == 0:
+            tmp.touch()
+        os.replace(tmp, UPLOAD_DIRECTORY / name)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return FileInfo(filename=name, size=size, sha256=hasher.hexdigest())
+
+
+# ───────────────────────────── simple uploads ──────────────────────────────────
+@router.post("/uploadfile", response_model=FileInfo)
+async def upload_file(file: UploadFile = File(...)):
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No file provided")
+    return await _save_whole(safe_name(file.filename), _upload_chunks(file))
+
+
+@router.put("/uploadfile/{filename}", response_model=FileInfo)
+async def upload_raw(filename: str, request: Request):
+    """Raw body upload – streamed straight from the socket, no multipart spooling."""
+    length = request.headers.get("content-length")
+    if length and not length.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if length and int(length) > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {UPLOAD_MAX_BYTES} bytes")
+    return await _save_whole(safe_name(filename), request.stream())
+
+
+# ─────────────────────────── resumable uploads ─────────────────────────────────
+_hashers: Dict[str, "hashlib._Hash"] = {}     # sha256 מצטבר; אחרי restart – מחושב מחדש מהקובץ
+_locks: Dict[str, asyncio.Lock] = {}
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _paths(upload_id: str) -> Tuple[Path, Path]:
+    if not _ID_RE.match(upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return PARTIAL_DIRECTORY / f"{upload_id}.part", PARTIAL_DIRECTORY / f"{upload_id}.json"
+
+
+def _load(upload_id: str) -> Tuple[dict, Path, Path]:
+    part, meta_path = _paths(upload_id)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return meta, part, meta_path
+
+
+def _status(upload_id: str, meta: dict, part: Path) -> UploadStatus:
+    return UploadStatus(upload_id=upload_id, filename=meta["filename"],
+                        offset=part.stat().st_size if part.exists() else 0, size=meta.get("size"))
+
+
+def _forget(upload_id: str) -> None:
+    _hashers.pop(upload_id, None)
+    _locks.pop(upload_id, None)
+
+
+def _purge_expired() -> None:
+    cutoff = time.time() - UPLOAD_SESSION_TTL
+    for meta_path in PARTIAL_DIRECTORY.glob("*.json"):
+        try:
+            if meta_path.stat().st_mtime < cutoff:
+                meta_path.with_suffix(".part").unlink(missing_ok=True)
+                meta_path.unlink(missing_ok=True)
+                _forget(meta_path.stem)
+        except OSError:
+            pass
+
+
+@router.post("/uploads", response_model=UploadStatus, status_code=status.HTTP_201_CREATED)
+async def create_upload(body: UploadCreate):
+    name = safe_name(body.filename)
+    if body.size is not None and not 0 <= body.size <= UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {UPLOAD_MAX_BYTES} bytes")
+    await asyncio.to_thread(_purge_expired)
+    upload_id = uuid.uuid4().hex
+    part, meta_path = _paths(upload_id)
+    meta = {"filename": name, "size": body.size, "sha256": body.sha256, "created": time.time()}
+    part.touch()
+    meta_path.write_text(json.dumps(meta), encoding="utf-8")
+    _hashers[upload_id] = hashlib.sha256()
+    return _status(upload_id, meta, part)
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadStatus)
+async def upload_status(upload_id: str):
+    meta, part, _ = _load(upload_id)
+    return _status(upload_id, meta, part)
+
+
+@router.put("/uploads/{upload_id}", response_model=UploadStatus)
+async def upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """Append the request body at ``offset`` – it must equal the bytes received so far."""
+    meta, part, meta_path = _load(upload_id)
+    lock = _locks.setdefault(upload_id, asyncio.Lock())
+    if lock.locked():
+        raise HTTPException(status_code=409, detail="Another chunk for this upload is in progress")
+    async with lock:
+        current = part.stat().st_size
+        if offset != current:
+            raise HTTPException(status_code=409, detail={"message": "Offset mismatch", "offset": current})
+        hasher = _hashers.get(upload_id)
+        if hasher is None:
+            hasher = _hashers[upload_id] = await asyncio.to_thread(_hash_file, part)
+        limit = min(UPLOAD_MAX_BYTES, meta["size"]) if meta.get("size") is not None else UPLOAD_MAX_BYTES
+        try:
+            await write_stream(request.stream(), part, hasher, start=current, limit=limit)
+        except BaseException:
+            # ה-hash כבר לא תואם לקובץ (chunk חלקי) – יחושב מחדש בפעם הבאה
+            _hashers.pop(upload_id, None)
+            raise
+        os.utime(meta_path)             # פעילות – לא לפנות כ"נטוש"
+    return _status(upload_id, meta, part)
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=FileInfo)
+async def complete_upload(upload_id: str):
+    meta, part, meta_path = _load(upload_id)
+    async with _locks.setdefault(upload_id, asyncio.Lock()):
+        try:
+            size = part.stat().st_size
+            if meta.get("size") is not None and size != meta["size"]:
+                raise HTTPException(status_code=409, detail={"message": "Upload incomplete", "offset": size})
+            hasher = _hashers.get(upload_id) or await asyncio.to_thread(_hash_file, part)
+            digest = hasher.hexdigest()
+            if meta.get("sha256") and meta["sha256"].lower() != digest:
+                raise HTTPException(status_code=422, detail={"message": "sha256 mismatch", "sha256": digest})
+            os.replace(part, UPLOAD_DIRECTORY / meta["filename"])
+        except FileNotFoundError:
+            # complete מקביל כבר פרסם את הקובץ (או abort מחק אותו)
+            raise HTTPException(status_code=404, detail="Upload not found")
+        meta_path.unlink(missing_ok=True)
+    _forget(upload_id)
+    return FileInfo(filename=meta["filename"], size=size, sha256=digest)
+
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload(upload_id: str):
+    _, part, meta_path = _load(upload_id)
+    part.unlink(missing_ok=True)
+    meta_path.unlink(missing_ok=True)
+    _forget(upload_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+# ───────────────────────────── downloads ───────────────────────────────────────
+@router.get("/downloadfile/{filename}")
+async def download_file(filename: str, request: Request):
+    """``FileResponse`` serves ``Range`` / ``If-Range`` and the validators; only 304 is ours."""
+    path = UPLOAD_DIRECTORY / safe_name(filename)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    response = FileResponse(path, filename=path.name, stat_result=path.stat())
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or response.headers["etag"] in [t.strip() for t in inm.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers={k: response.headers[k] for k in ("etag", "last-modified")})
+    return response
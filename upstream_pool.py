@@ -0,0 +1,153 @@
+"""upstream_pool.py – pre-warmed OpenAI Realtime connections
+----------------------------------------------------------
+Without a pool, every client session waits for a TLS WebSocket handshake to
+the realtime API plus a ``session.update`` before any audio can flow.
+``UpstreamPool`` keeps up to ``UPSTREAM_POOL_SIZE`` connections open and
+configured in advance:
+
+• ``acquire`` hands out the freshest idle connection. If the pool is empty it
+  falls back to connecting on demand, so a cold or failing pool is never worse
+  than no pool.
+• A background task refills the pool after every acquire. It closes
+  connections idle for longer than ``UPSTREAM_POOL_MAX_IDLE`` seconds and
+  pings the rest every ``UPSTREAM_POOL_HEALTH_INTERVAL`` seconds, dropping any
+  that do not answer.
+• Connect failures back off exponentially, up to 30 s.
+
+``connect`` is the coroutine that opens and configures one connection
+(``Proxy._connect_upstream``), so pooled and on-demand sessions are identical.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+from metrics import UPSTREAM_POOL_ACQUIRE
+
+log = logging.getLogger("rt-pool")
+
+UPSTREAM_POOL_SIZE            = int(os.getenv("UPSTREAM_POOL_SIZE", "2"))
+UPSTREAM_POOL_MAX_IDLE        = float(os.getenv("UPSTREAM_POOL_MAX_IDLE", "300"))
+UPSTREAM_POOL_HEALTH_INTERVAL = float(os.getenv("UPSTREAM_POOL_HEALTH_INTERVAL", "20"))
+UPSTREAM_POOL_PING_TIMEOUT    = float(os.getenv("UPSTREAM_POOL_PING_TIMEOUT", "5"))
+MAX_BACKOFF = 30.0
+
+
+def _is_open(ws) -> bool:
+    # websockets legacy client → .open; ה-API החדש → .state
+    is_open = getattr(ws, "open", None)
+    if is_open is not None:
+        return bool(is_open)
+    return getattr(getattr(ws, "state", None), "name", "") == "OPEN"
+
+
+class UpstreamPool:
+    def __init__(self, connect: Callable[[], Awaitable], size: int = UPSTREAM_POOL_SIZE,
+                 max_idle: float = UPSTREAM_POOL_MAX_IDLE,
+                 health_interval: float = UPSTREAM_POOL_HEALTH_INTERVAL,
+                 ping_timeout: float = UPSTREAM_POOL_PING_TIMEOUT):
+        self.connect = connect
+        self.size = size
+        self.max_idle = max_idle
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self._idle: Deque[Tuple[object, float]] = deque()     # (ws, created) – החדש ביותר בסוף
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def idle(self) -> int:
+        return len(self._idle)
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        if self._task is None and self.size > 0:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._idle:
+            ws, _ = self._idle.pop()
+            await self._close(ws)
+
+    # ---------- API ----------
+    async def acquire(self):
+        """A ready upstream connection – pooled if possible, otherwise connected now."""
+        while self._idle:
+            ws, created = self._idle.pop()
+            if _is_open(ws) and time.monotonic() - created < self.max_idle:
+                UPSTREAM_POOL_ACQUIRE.inc(outcome="hit")
+                self._wake.set()
+                return ws
+            await self._close(ws)
+        UPSTREAM_POOL_ACQUIRE.inc(outcome="miss")
+        self._wake.set()
+        return await self.connect()
+
+    # ---------- background ----------
+    async def _maintain(self) -> None:
+        backoff = 1.0
+        last_check = time.monotonic()
+        while True:
+            await self._evict_stale()
+            if time.monotonic() - last_check >= self.health_interval:
+                await self._health_check()
+                last_check = time.monotonic()
+
+            while len(self._idle) < self.size:
+                try:
+                    ws = await self.connect()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    log.warning("Upstream pool connect failed (retry in %.0fs): %s", backoff, e)
+                    await asyncio.sleep(backoff)
+                    backoff = min(MAX_BACKOFF, backoff * 2)
+                    break
+                backoff = 1.0
+                self._idle.append((ws, time.monotonic()))
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.health_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _evict_stale(self) -> None:
+        now = time.monotonic()
+        # מוציאים מה-deque לפני כל await – acquire יכול לרוץ בינתיים
+        stale = [e for e in self._idle if not _is_open(e[0]) or now - e[1] >= self.max_idle]
+        for entry in stale:
+            self._idle.remove(entry)
+        for ws, _ in stale:
+            await self._close(ws)
+
+    async def _health_check(self) -> None:
+        for entry in list(self._idle):
+            ws = entry[0]
+            try:
+                pong = await ws.ping()
+                await asyncio.wait_for(pong, self.ping_timeout)
+            except Exception:
+                # אם acquire כבר לקח את החיבור – זה עניין של ה-session, לא של ה-pool
+                if entry in self._idle:
+                    log.info("Dropping unhealthy pooled upstream connection")
+                    self._idle.remove(entry)
+                    await self._close(ws)
+
+    async def _close(self, ws) -> None:
+        # חיבור שלא עונה גם לא ישלים close handshake – לא מחכים לו close_timeout שלם
+        try:
+            await asyncio.wait_for(ws.close(), self.ping_timeout)
+        except Exception:
+            transport = getattr(ws, "transport", None)
+            if transport is not None:
+                transport.abort()
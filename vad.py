@@ -0,0 +1,103 @@
+"""vad.py – energy-based voice activity detection for the realtime proxy
+-----------------------------------------------------------------------
+``VoiceActivityDetector`` consumes raw PCM16 (mono, little-endian) in whatever
+chunk sizes the client sends and returns only the audio worth forwarding:
+
+• audio is cut into ``VAD_FRAME_MS`` frames and the RMS level of all frames
+  in a chunk is computed in one NumPy pass (dBFS);
+• frames above ``VAD_THRESHOLD_DB`` are speech. Leading silence is dropped,
+  except for ``VAD_PREROLL_MS`` before the first speech frame, and trailing
+  silence is kept only for ``VAD_HANGOVER_MS``;
+• after ``VAD_COMMIT_SILENCE_MS`` of silence the utterance has ended.
+  ``feed`` reports this once, if the utterance had at least
+  ``VAD_MIN_SPEECH_MS`` of speech, so the proxy can commit on its own.
+
+Only raw PCM goes through the detector: the proxy passes a whole WAV/AIFF/FLAC
+upload (see ``stt.is_audio_file``) through untouched, header included.
+"""
+
+import os
+from collections import deque
+from typing import Tuple
+
+import numpy as np
+
+VAD_ENABLED           = os.getenv("VAD_ENABLED", "1") == "1"
+VAD_AUTO_COMMIT       = os.getenv("VAD_AUTO_COMMIT", "0") == "1"
+VAD_FRAME_MS          = int(os.getenv("VAD_FRAME_MS", "20"))
+VAD_THRESHOLD_DB      = float(os.getenv("VAD_THRESHOLD_DB", "-45"))
+VAD_PREROLL_MS        = int(os.getenv("VAD_PREROLL_MS", "200"))
+VAD_HANGOVER_MS       = int(os.getenv("VAD_HANGOVER_MS", "300"))
+VAD_COMMIT_SILENCE_MS = int(os.getenv("VAD_COMMIT_SILENCE_MS", "700"))
+VAD_MIN_SPEECH_MS     = int(os.getenv("VAD_MIN_SPEECH_MS", "200"))
+
+
+def frame_levels_db(pcm: bytes, frame_samples: int) -> np.ndarray:
+    """dBFS per whole frame of ``pcm`` (a partial last frame is ignored)."""
+    samples = np.frombuffer(pcm, dtype="<i2")
+    n = len(samples) // frame_samples
+    frames = samples[: n * frame_samples].reshape(n, frame_samples).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(rms / 32768.0 + 1e-10)
+
+
+class VoiceActivityDetector:
+    def __init__(self, sample_rate: int, frame_ms: int = VAD_FRAME_MS,
+                 threshold_db: float = VAD_THRESHOLD_DB, preroll_ms: int = VAD_PREROLL_MS,
+                 hangover_ms: int = VAD_HANGOVER_MS, commit_silence_ms: int = VAD_COMMIT_SILENCE_MS,
+                 min_speech_ms: int = VAD_MIN_SPEECH_MS):
+        self.frame_samples = max(1, sample_rate * frame_ms // 1000)
+        self.frame_bytes = self.frame_samples * 2
+        self.threshold_db = threshold_db
+        self.hangover = hangover_ms // frame_ms
+        self.commit_silence = max(1, commit_silence_ms // frame_ms)
+        self.min_speech = min_speech_ms // frame_ms
+        self._preroll: deque = deque(maxlen=max(0, preroll_ms // frame_ms))
+        self._rest = b""                 # שארית שלא ממלאת frame שלם
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the current utterance (after a manual commit)."""
+        self._rest = b""
+        self.in_speech = False
+        self._silence = 0
+        self._speech = 0
+        self._preroll.clear()
+
+    def feed(self, pcm: bytes) -> Tuple[bytes, bool]:
+        """Return ``(audio_to_forward, utterance_ended)`` for the next chunk."""
+        data = self._rest + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._rest = data[usable:]
+        if not usable:
+            return b"", False
+
+        speech = frame_levels_db(data[:usable], self.frame_samples) > self.threshold_db
+        out = bytearray()
+        ended = False
+        fb = self.frame_bytes
+        for i, is_speech in enumerate(speech.tolist()):
+            frame = data[i * fb:(i + 1) * fb]
+            if is_speech:
+                if self._preroll:
+                    out += b"".join(self._preroll)
+                    self._preroll.clear()
+                out += frame
+                self.in_speech = True
+                self._silence = 0
+                self._speech += 1
+            elif self.in_speech:
+                self._silence += 1
+                if self._silence <= self.hangover:
+                    out += frame
+                else:
+                    # שקט ארוך באמצע משפט – לא נשלח, אבל ישמש preroll אם הדיבור חוזר
+                    self._preroll.append(frame)
+                if self._silence >= self.commit_silence:
+                    ended = ended or self._speech >= self.min_speech
+                    self.in_speech = False
+                    self._speech = 0
+                    self._preroll.clear()
+            else:
+                self._preroll.append(frame)
+        return bytes(out), ended